@@ -8,21 +8,54 @@ This package provides utilities for Python development including:
 - File system operations with gitignore support
 """
 
+import importlib
+from typing import TYPE_CHECKING, Any
+
+# Hardcoded so reading the version never parses package metadata
 __version__ = "0.1.6"
 __author__ = "askender"
 __email__ = "askender43@gmail.com"
 
-# Import main utilities for convenient access
-from .utils.git_utils import is_valid_git_repo
-from .utils.os_utils import list_all_files, load_gitignore, should_ignore
-from .utils.simple_ast import (
-    extract_class_methods,
-    extract_function_signatures,
-    extract_inheritance_relations,
-    find_enclosing_function,
-    find_function_references,
-    find_unused_imports,
-)
+if TYPE_CHECKING:
+    from .utils.git_utils import is_valid_git_repo
+    from .utils.os_utils import list_all_files, load_gitignore, should_ignore
+    from .utils.simple_ast import (
+        extract_class_methods,
+        extract_function_signatures,
+        extract_inheritance_relations,
+        find_enclosing_function,
+        find_function_references,
+        find_unused_imports,
+    )
+
+# Main utilities for convenient access, imported on first use so that
+# `from codn import __version__` stays cheap
+_LAZY_ATTRS = {
+    "is_valid_git_repo": ".utils.git_utils",
+    "list_all_files": ".utils.os_utils",
+    "load_gitignore": ".utils.os_utils",
+    "should_ignore": ".utils.os_utils",
+    "extract_class_methods": ".utils.simple_ast",
+    "extract_function_signatures": ".utils.simple_ast",
+    "extract_inheritance_relations": ".utils.simple_ast",
+    "find_enclosing_function": ".utils.simple_ast",
+    "find_function_references": ".utils.simple_ast",
+    "find_unused_imports": ".utils.simple_ast",
+}
+
+
+def __getattr__(name: str) -> Any:
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_LAZY_ATTRS))
+
 
 __all__ = [
     "__author__",
@@ -1,46 +1,97 @@
+import os
+import sys
+from typing import Optional
+
+
+def _wants_version(argv: list[str]) -> bool:
+    """Return True if ``-V``/``--version`` appears before any subcommand."""
+    for arg in argv[1:]:
+        if not arg.startswith("-"):
+            return False
+        if arg in ("-V", "--version"):
+            return True
+    return False
+
+
+# 所有直接命令与子命令组的名字, 每次启动都要查询, 用 frozenset 做 O(1) 判断
+_KNOWN_SUBCOMMANDS = frozenset(("unused", "refs", "funcs", "git", "analyze", "lsp"))
+
+
+def _sniff_subcommand(argv: list[str]) -> Optional[str]:
+    """Return the first known subcommand name in ``argv``, if any."""
+    for arg in argv[1:]:
+        if arg and arg[0] != "-" and arg in _KNOWN_SUBCOMMANDS:
+            return arg
+    return None
+
+
+# 作为命令行入口运行时才根据 sys.argv 做快速路径/按需加载
+_IS_ENTRY = __name__ == "__main__" or os.path.basename(sys.argv[0]) in (
+    "codn",
+    "codn.exe",
+)
+
+
+def _print_version() -> None:
+    """Write the version line without going through Rich."""
+    from codn import __version__
+
+    if sys.stdout.isatty():
+        sys.stdout.write(
+            f"\x1b[1;34mcodn\x1b[0m version \x1b[32m{__version__}\x1b[0m\n"
+        )
+    else:
+        sys.stdout.write(f"codn version {__version__}\n")
+
+
+# 快速路径: `codn -V` 在导入 typer/rich/子命令之前直接输出版本并退出
+if _IS_ENTRY and _wants_version(sys.argv):
+    _print_version()
+    sys.exit(0)
+
+import importlib
+import importlib.util
 from pathlib import Path
-from typing import Annotated, Optional
+from types import ModuleType
+from typing import Annotated
 
 import typer
-from rich.console import Console
-
-from codn import __version__
-from codn.cli_commands import analyze_cli, git_cli, lsp_cli
-from codn.cli_commands.analyze_cli import (
-    analyze_functions,
-    analyze_project,
-    find_references,
-    find_unused_imports_cmd,
-)
 
-console = Console()
 
-app = typer.Typer(
-    help="🔍 Codn - Fast Python code analysis.",
-    rich_markup_mode="rich",
-    invoke_without_command=True,
-)
+def _lazy_import(name: str) -> ModuleType:
+    """Import ``name`` lazily: its body only runs on first attribute access."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"No module named {name!r}")
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    parent, _, child = name.rpartition(".")
+    setattr(sys.modules[parent], child, module)
+    return module
 
-# 注册子命令组
-app.add_typer(
-    git_cli.app,
-    name="git",
-    help="🔧 Git repository validation and health checks",
-)
-app.add_typer(
-    analyze_cli.app,
-    name="analyze",
-    help="📊 Code analysis and statistics",
-)
-app.add_typer(
-    lsp_cli.app,
-    name="lsp",
-    help="📊 Code lsp and understanding",
-)
+
+analyze_cli = _lazy_import("codn.cli_commands.analyze_cli")
+
+# 子命令组: name -> help
+SUBCOMMANDS = {
+    "git": "🔧 Git repository validation and health checks",
+    "analyze": "📊 Code analysis and statistics",
+    "lsp": "📊 Code lsp and understanding",
+}
+
+
+def _register_subcommand(app: typer.Typer, name: str) -> None:
+    """Import ``codn.cli_commands.<name>_cli`` and mount its app."""
+    mod = importlib.import_module(f"codn.cli_commands.{name}_cli")
+    app.add_typer(mod.app, name=name, help=SUBCOMMANDS[name])
 
 
 # 添加简化的直接命令
-@app.command("unused")
 def unused_imports(
     path: Annotated[
         Optional[Path],
@@ -60,10 +111,9 @@ def unused_imports(
     ] = False,
 ) -> None:
     """🧹 Find unused imports in Python files."""
-    find_unused_imports_cmd(path, include_tests=include_tests, fix=fix)
+    analyze_cli.find_unused_imports_cmd(path, include_tests=include_tests, fix=fix)
 
 
-@app.command("refs")
 def find_refs(
     function_name: Annotated[
         str,
@@ -80,10 +130,9 @@ def find_refs(
     ] = False,
 ) -> None:
     """🔍 Find all references to a function."""
-    find_references(function_name, path, include_tests=include_tests)
+    analyze_cli.find_references(function_name, path, include_tests=include_tests)
 
 
-@app.command("funcs")
 def functions(
     path: Annotated[
         Optional[Path],
@@ -104,7 +153,7 @@ def functions(
     ] = False,
 ) -> None:
     """📝 List all functions and methods."""
-    analyze_functions(
+    analyze_cli.analyze_functions(
         path,
         class_name=class_name,
         show_signatures=show_signatures,
@@ -112,7 +161,6 @@ def functions(
     )
 
 
-@app.callback()
 def main(
     ctx: typer.Context,
     *,
@@ -135,14 +183,51 @@ def main(
       codn funcs        - List all functions
     """
     if version:
-        console.print(
-            f"[bold blue]codn[/bold blue] version [green]{__version__}[/green]",
-        )
+        _print_version()
         raise typer.Exit
 
     # 如果没有子命令, 默认执行项目分析
     if ctx.invoked_subcommand is None:
-        analyze_project(Path.cwd(), include_tests=False, verbose=verbose)
+        analyze_cli.analyze_project(Path.cwd(), include_tests=False, verbose=verbose)
+
+
+# 直接命令: name -> function
+COMMANDS = {
+    "unused": unused_imports,
+    "refs": find_refs,
+    "funcs": functions,
+}
+
+
+def _build_app(sub: Optional[str], *, lazy: bool = False) -> typer.Typer:
+    """Build the Typer app.
+
+    With ``lazy`` set only the command or group named by ``sub`` is registered,
+    so Typer does not build Click commands (or import the group modules) that
+    this invocation never uses. Without ``sub`` (``codn``, ``codn --help``,
+    typos) every direct command is registered and the groups are mounted as
+    empty stubs carrying just their help text.
+    """
+    app = typer.Typer(
+        help="🔍 Codn - Fast Python code analysis.",
+        rich_markup_mode="rich",
+        invoke_without_command=True,
+    )
+    app.callback()(main)
+
+    register_all = not lazy or sub is None
+    for name, func in COMMANDS.items():
+        if register_all or name == sub:
+            app.command(name)(func)
+    for name, help_text in SUBCOMMANDS.items():
+        if not lazy or name == sub:
+            _register_subcommand(app, name)
+        elif register_all:
+            app.add_typer(typer.Typer(), name=name, help=help_text)
+    return app
+
+
+app = _build_app(_sniff_subcommand(sys.argv), lazy=_IS_ENTRY)
 
 
 if __name__ == "__main__":
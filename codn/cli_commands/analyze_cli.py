@@ -4,11 +4,7 @@ from pathlib import Path
 from typing import Annotated, Optional
 
 import typer
-from rich.columns import Columns
 from rich.console import Console
-from rich.panel import Panel
-from rich.progress import BarColumn, Progress, TextColumn, TimeRemainingColumn
-from rich.table import Table
 
 from ..utils.git_utils import is_valid_git_repo
 from ..utils.os_utils import list_all_files_sync
@@ -18,6 +14,7 @@ from ..utils.simple_ast import (
     find_function_references,
     find_unused_imports,
 )
+from .welcome import show_welcome
 
 app = typer.Typer(help="Code analysis commands", invoke_without_command=True)
 console = Console()
@@ -34,25 +31,23 @@ def analyze_main(ctx: typer.Context) -> None:
         show_analyze_welcome()
 
 
-def show_analyze_welcome() -> None:
-    """Display simple welcome message for analyze command."""
-
-    console.print()
-    console.print("[bold blue]📊 Analysis Commands[/bold blue]")
-    console.print()
+# (command, description) rows of the welcome screen
+ANALYZE_COMMANDS = (
+    ("project", "📈 Project overview & quality score"),
+    ("unused-imports", "🧹 Find unused imports"),
+    ("find-refs <func>", "🔍 Find function references"),
+    ("functions", "📝 List all functions"),
+)
 
-    # Simple command list
-    console.print("[cyan]project[/cyan]           📈 Project overview & quality score")
-    console.print("[cyan]unused-imports[/cyan]   🧹 Find unused imports")
-    console.print("[cyan]find-refs <func>[/cyan] 🔍 Find function references")
-    console.print("[cyan]functions[/cyan]        📝 List all functions")
 
-    console.print()
-    console.print(
-        "[bold yellow]💡 Tip:[/bold yellow] Use [green]codn[/green] "
-        "(without analyze) for shorter commands!",
+def show_analyze_welcome() -> None:
+    """Display simple welcome message for analyze command."""
+    show_welcome(
+        console,
+        "analyze",
+        "📊 Analysis Commands",
+        ANALYZE_COMMANDS,
     )
-    console.print("[dim]Examples: codn unused, codn refs <func>, codn funcs[/dim]")
 
 
 @app.command("project")
@@ -72,6 +67,11 @@ def analyze_project(
     ] = False,
 ) -> None:
     """Analyze project structure and provide statistics."""
+    from rich.columns import Columns
+    from rich.panel import Panel
+    from rich.progress import BarColumn, Progress, TextColumn, TimeRemainingColumn
+    from rich.table import Table
+
     if path is None:
         path = Path.cwd()
 
@@ -324,6 +324,9 @@ def find_references(
     ] = False,
 ) -> None:
     """Find all references to a function in the project."""
+    from rich.panel import Panel
+    from rich.progress import BarColumn, Progress, TextColumn, TimeRemainingColumn
+
     if path is None:
         path = Path.cwd()
 
@@ -420,6 +423,9 @@ def find_unused_imports_cmd(
     ] = False,
 ) -> None:
     """Find unused imports in Python files."""
+    from rich.panel import Panel
+    from rich.progress import BarColumn, Progress, TextColumn, TimeRemainingColumn
+
     if path is None:
         path = Path.cwd()
 
@@ -550,6 +556,10 @@ def analyze_functions(
     ] = False,
 ) -> None:
     """Analyze functions and methods in the project."""
+    from rich.panel import Panel
+    from rich.progress import BarColumn, Progress, TextColumn, TimeRemainingColumn
+    from rich.table import Table
+
     if path is None:
         path = Path.cwd()
 
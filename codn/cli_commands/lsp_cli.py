@@ -5,7 +5,6 @@ from typing import Annotated  # Optional
 
 import typer
 from rich.console import Console
-from rich.panel import Panel
 # from rich.columns import Columns
 # from rich.progress import BarColumn, Progress, TextColumn
 # TaskProgressColumn
@@ -17,6 +16,7 @@ from codn.utils.base_lsp_client import (
     get_snippet,
     get_refs,
 )
+from .welcome import show_welcome
 
 app = typer.Typer(help="Code analysis commands", invoke_without_command=True)
 console = Console()
@@ -33,26 +33,21 @@ def lsp_main(ctx: typer.Context) -> None:
         show_lsp_welcome()
 
 
-def show_lsp_welcome() -> None:
-    """Display simple welcome message for lsp command."""
-
-    console.print()
-    console.print("[bold blue]📊 LSP Commands[/bold blue]")
-    console.print()
+# (command, description) rows of the welcome screen
+LSP_COMMANDS = (
+    ("search <func>", "🔍 Find code snippets"),
+    ("refs <func>", "🔍 Find function references"),
+)
 
-    # Simple command list
-    console.print("[cyan]search <func>[/cyan] 🔍 Find code snippets")
-    console.print("[cyan]refs <func>[/cyan] 🔍 Find function references")
-    # console.print("[cyan]functions[/cyan]        📝 List all functions")
-    # console.print("[cyan]project[/cyan]           📈 Project overview & quality score")
-    # console.print("[cyan]unused-imports[/cyan]   🧹 Find unused imports")
 
-    console.print()
-    console.print(
-        "[bold yellow]💡 Tip:[/bold yellow] Use [green]codn[/green] "
-        "(without lsp) for shorter commands!",
+def show_lsp_welcome() -> None:
+    """Display simple welcome message for lsp command."""
+    show_welcome(
+        console,
+        "lsp",
+        "📊 LSP Commands",
+        LSP_COMMANDS,
     )
-    console.print("[dim]Examples: codn unused, codn refs <func>, codn funcs[/dim]")
 
 
 @app.command("search")
@@ -72,6 +67,8 @@ async def search(
     ] = False,
 ) -> None:
     """Find all snippets to a function in the project."""
+    from rich.panel import Panel
+
     if not path:
         path = str(Path.cwd())
 
@@ -140,6 +137,8 @@ async def find_references(
     ] = False,
 ) -> None:
     """Find all references to a function in the project."""
+    from rich.panel import Panel
+
     pass
 
     if not path:
@@ -0,0 +1,54 @@
+"""Shared welcome screen for the codn subcommand groups."""
+
+from collections.abc import Sequence
+
+from rich.console import Console
+from rich.text import Text
+
+# group name -> rendered ANSI text
+_WELCOME_CACHE: dict[str, str] = {}
+
+
+def show_welcome(
+    console: Console,
+    group: str,
+    title: str,
+    commands: Sequence[tuple[str, str]],
+) -> None:
+    """Display the welcome message of a subcommand group.
+
+    The screen is static, so it is rendered once per group and the ANSI output
+    reused on later calls. Lines are built as styled ``Text`` objects directly,
+    which skips Rich's markup parser.
+    """
+    cached = _WELCOME_CACHE.get(group)
+    if cached is None:
+        width = max(len(cmd) for cmd, _ in commands) + 1
+        with console.capture() as capture:
+            console.print()
+            console.print(Text(title, style="bold blue"))
+            console.print()
+
+            # Simple command list
+            for cmd, desc in commands:
+                console.print(
+                    Text.assemble((cmd, "cyan"), " " * (width - len(cmd)), desc)
+                )
+
+            console.print()
+            console.print(
+                Text.assemble(
+                    ("💡 Tip:", "bold yellow"),
+                    " Use ",
+                    ("codn", "green"),
+                    f" (without {group}) for shorter commands!",
+                )
+            )
+            console.print(
+                Text(
+                    "Examples: codn unused, codn refs <func>, codn funcs",
+                    style="dim",
+                )
+            )
+        cached = _WELCOME_CACHE[group] = capture.get()
+    console.file.write(cached)
@@ -1,14 +1,29 @@
+import asyncio
+import contextlib
+import functools
+import keyword
 import re
+import shutil
+import sys
 import os
+from collections import defaultdict
+from collections.abc import Collection
+from itertools import accumulate
 from pathlib import Path
 from codn.utils.lsp_core import BaseLSPClient, LSPError  # noqa
-from typing import Any
+from contextvars import ContextVar
+from typing import Any, Optional, Union
 from loguru import logger
 from codn.utils.os_utils import LANG_TO_LANGUAGE, LANG_TO_EXTENSION
 from codn.utils.os_utils import list_all_files, detect_dominant_languages
-from codn.utils.lsp_utils import extract_code, find_enclosing_function
+from codn.utils.symbol_cache import SymbolCache, cache_enabled, content_hash
+from codn.utils.lsp_utils import (
+    build_function_index,
+    find_enclosing_function,  # noqa: F401
+    lookup_enclosing_function,
+)
 from urllib.parse import unquote, urlparse
-from watchfiles import awatch  # type: ignore[reportUnknownVariableType]
+from watchfiles import Change, awatch  # type: ignore[reportUnknownVariableType]
 from enum import IntEnum
 
 
@@ -42,23 +57,95 @@ class SymbolKind(IntEnum):
 
 
 # Symbols to ignore in most traversals
-l_sym_ignore = [
-    SymbolKind.VARIABLE,
-    SymbolKind.CONSTANT,
-    SymbolKind.FIELD,
-    SymbolKind.ENUM,
-    SymbolKind.STRING,
-    SymbolKind.CONSTRUCTOR,
-    SymbolKind.NAMESPACE,
-    SymbolKind.PROPERTY,
-]
+SYM_IGNORE = frozenset(
+    (
+        SymbolKind.VARIABLE,
+        SymbolKind.CONSTANT,
+        SymbolKind.FIELD,
+        SymbolKind.ENUM,
+        SymbolKind.STRING,
+        SymbolKind.CONSTRUCTOR,
+        SymbolKind.NAMESPACE,
+        SymbolKind.PROPERTY,
+    )
+)
+l_sym_ignore = SYM_IGNORE  # 旧名称
+KINDS_FUNC = frozenset((SymbolKind.FUNCTION, SymbolKind.METHOD))
+KINDS_FUNC_CLASS = frozenset((SymbolKind.FUNCTION, SymbolKind.METHOD, SymbolKind.CLASS))
+KINDS_SKIP_IN_REFS = frozenset(
+    (
+        SymbolKind.VARIABLE,
+        SymbolKind.CONSTANT,
+        SymbolKind.ENUM,
+        SymbolKind.FIELD,
+        SymbolKind.STRING,
+    )
+)
+KINDS_VARIABLE = frozenset((SymbolKind.VARIABLE, SymbolKind.CONSTANT))
+
+
+@functools.lru_cache(maxsize=4096)
+def _file_uri_cached(path_str: str, cwd: str) -> str:
+    return Path(cwd, path_str).resolve().as_uri()
 
 
 def path_to_file_uri(path_str: str) -> str:
-    return Path(path_str).resolve().as_uri()
+    # resolve() 每次都要逐级 stat；监听和批量打开时同一路径反复出现，按路径缓存
+    cwd = "" if os.path.isabs(path_str) else os.getcwd()
+    return _file_uri_cached(path_str, cwd)
+
+
+@functools.lru_cache(maxsize=128)
+def _resolve_root_cached(path_str: str, cwd: str) -> tuple[Path, str, int]:
+    root_path = Path(cwd, path_str).resolve()
+    root_uri = root_path.as_uri()
+    return root_path, root_uri, len(root_uri)
+
+
+def _resolve_root(path_str: str) -> tuple[Path, str, int]:
+    """解析项目根目录，返回 (root_path, root_uri, len(root_uri))，结果按路径缓存"""
+    # 相对路径依赖当前工作目录，需一并作为缓存键
+    cwd = "" if os.path.isabs(path_str) else os.getcwd()
+    return _resolve_root_cached(path_str, cwd)
 
 
-def extract_symbol_code(sym: dict[str, Any], content: str, strip: bool = False) -> str:
+def _nth_newline_offset(s: str, n: int, start: int = -1) -> int:
+    """从 start 之后查找第 n 个换行符的位置，找不到返回 -1"""
+    off = start
+    for _ in range(n):
+        off = s.find("\n", off + 1)
+        if off < 0:
+            return -1
+    return off
+
+
+def _slice_lines(content: str, start: int, end: int) -> str:
+    """返回第 start 到 end-1 行（同 split 后切片再 join），但不拆分整个文件"""
+    if start < 0 or end < 0:
+        return "\n".join(content.split("\n")[start:end])
+    if end <= start:
+        return ""
+    start_off = _nth_newline_offset(content, start) + 1
+    if start and start_off == 0:
+        return ""
+    end_off = _nth_newline_offset(content, end - start, start_off - 1)
+    if end_off < 0:
+        end_off = len(content)
+    return content[start_off:end_off]
+
+
+def _line_offsets(content: str) -> list[int]:
+    """每行起始偏移，末尾多一项 len(content)+1，第 i 行为 [offs[i], offs[i+1]-1)"""
+    return list(accumulate((len(line) + 1 for line in content.split("\n")), initial=0))
+
+
+def extract_symbol_code(
+    sym: dict[str, Any],
+    content: str,
+    strip: bool = False,
+    line_offsets: Optional[list[int]] = None,
+) -> str:
+    """line_offsets 为 _line_offsets(content)；同一文件提取多个符号时传入可避免逐行查找"""
     try:
         rng = sym.get("location", {}).get("range", {})
         if not rng:
@@ -68,23 +155,47 @@ def extract_symbol_code(sym: dict[str, Any], content: str, strip: bool = False)
         end = rng.get("end", {})
         start_line, start_char = start.get("line", 0), start.get("character", 0)
         end_line, end_char = end.get("line", 0), end.get("character", 0)
+        if start_line < 0 or end_line < start_line:
+            return ""
 
-        lines = content.splitlines()
-        if not (0 <= start_line < len(lines) and 0 <= end_line < len(lines)):
+        if line_offsets is not None:
+            if end_line + 1 >= len(line_offsets):
+                return ""
+            start_off = line_offsets[start_line]
+            end_line_off = line_offsets[end_line]
+            end_off = line_offsets[end_line + 1] - 1
+        else:
+            # 只定位需要的行，避免对整个文件 splitlines
+            start_off = _nth_newline_offset(content, start_line) + 1
+            if start_line and start_off == 0:
+                return ""
+            end_line_off = _nth_newline_offset(
+                content, end_line - start_line, start_off - 1
+            )
+            if end_line != start_line and end_line_off < 0:
+                return ""
+            end_line_off += 1
+            end_off = content.find("\n", end_line_off)
+            if end_off < 0:
+                end_off = len(content)
+        if start_off >= len(content) or end_line_off >= len(content):
             return ""
 
+        code = content[start_off:end_off]
         if start_line == end_line:
-            line = lines[start_line]
+            line = code.removesuffix("\r")
             return line[start_char:end_char] if strip else line
 
-        code_lines = lines[start_line : end_line + 1]
-        if not code_lines:
-            return ""
+        has_cr = "\r" in code
+        if not strip and not has_cr:
+            return code
 
+        code_lines = code.split("\n")
+        if has_cr:
+            code_lines = [line.removesuffix("\r") for line in code_lines]
         if strip:
             code_lines[0] = code_lines[0][start_char:]
-            if len(code_lines) > 1:
-                code_lines[-1] = code_lines[-1][:end_char]
+            code_lines[-1] = code_lines[-1][:end_char]
 
         return "\n".join(code_lines)
     except Exception as e:
@@ -92,12 +203,23 @@ def extract_symbol_code(sym: dict[str, Any], content: str, strip: bool = False)
         return ""
 
 
-def _should_process_file(path_obj: Path, expected_extensions: tuple[str, ...]) -> bool:
-    path_str = str(path_obj)
+# 监听事件中需跳过的目录名（按路径分量整体匹配）
+SKIP_DIRS = frozenset((".git", "__pycache__", ".pytest_cache", "node_modules"))
+# 测试文件过滤：open_files 中的 uri 与引用结果中的 ref_uri
+SKIP_TEST_URI_RE = re.compile(r"test(s/|_)")
+SKIP_TEST_REF_RE = re.compile(r"test(s|_)")
+
+
+def _should_process_file(
+    path_obj: Union[str, Path], expected_extensions: tuple[str, ...]
+) -> bool:
+    # watchfiles 给出的是 str，直接使用，避免为每个事件构造 Path
+    path_str = path_obj if isinstance(path_obj, str) else str(path_obj)
     if not path_str.endswith(expected_extensions):
         return False
-    skip_dirs = {".git", "__pycache__", ".pytest_cache", "node_modules"}
-    return not any(part in path_obj.parts for part in skip_dirs)
+    if os.sep != "/":
+        path_str = path_str.replace(os.sep, "/")
+    return SKIP_DIRS.isdisjoint(path_str.split("/"))
 
 
 async def _handle_file_change(
@@ -113,7 +235,10 @@ async def _handle_file_change(
             await client.send_did_close(uri)
         else:
             try:
-                content = file_path.read_text(encoding="utf-8", errors="replace")
+                # 读文件放到线程池，避免批量变更时阻塞事件循环
+                content = await asyncio.to_thread(
+                    file_path.read_text, encoding="utf-8", errors="replace"
+                )
                 if change_name == "added":
                     await client.send_did_open(uri, content)
                 elif change_name == "modified":
@@ -125,6 +250,34 @@ async def _handle_file_change(
             logger.error(f"Error handling file change {file_path}: {e}")
 
 
+def _coalesce_changes(
+    changes: set[tuple[Change, str]],
+    expected_extensions: tuple[str, ...],
+    open_files: Collection[str] = (),
+) -> dict[Path, Change]:
+    """合并同一批次中同一路径的事件，每个路径只保留最终状态"""
+    d_kinds: dict[Path, dict[str, Change]] = {}
+    for change_type, path_obj in changes:
+        if not _should_process_file(path_obj, expected_extensions):
+            continue
+        file_path = Path(path_obj)
+        d_kinds.setdefault(file_path, {})[change_type.name] = change_type
+
+    pending: dict[Path, Optional[Change]] = {}
+    for file_path, kinds in d_kinds.items():
+        if len(kinds) == 1:
+            pending[file_path] = next(iter(kinds.values()))
+            continue
+        # awatch 返回的是无序集合，按文件当前是否存在来判断最终状态
+        if file_path.exists():
+            pending[file_path] = kinds.get("added") or kinds.get("modified")
+        elif path_to_file_uri(str(file_path)) in open_files:
+            # 批次产生后文件才被删除时可能没有 deleted 事件，仍需 didClose
+            pending[file_path] = Change.deleted
+        # 批次内先新增后删除：两者都丢弃
+    return {k: v for k, v in pending.items() if v is not None}
+
+
 async def watch_and_sync(client: BaseLSPClient, root_path: Path) -> None:
     if not root_path.exists():
         logger.error(f"Root path does not exist: {root_path}")
@@ -141,33 +294,115 @@ async def watch_and_sync(client: BaseLSPClient, root_path: Path) -> None:
 
     try:
         logger.trace(f"Starting file watcher for: {root_path}")
-        async for changes in awatch(root_path):
+        async for changes in awatch(root_path, debounce=300, step=50):
             if client.is_closing:
                 break
-            for change_type, path_obj in changes:
-                if client.is_closing:
-                    break
-                file_path = Path(path_obj)
-                if _should_process_file(file_path, expected_extensions):
-                    await _handle_file_change(client, change_type, file_path)
+            pending = _coalesce_changes(changes, expected_extensions, client.open_files)
+            if pending:
+                await asyncio.gather(
+                    *(
+                        _handle_file_change(client, change_type, file_path)
+                        for file_path, change_type in pending.items()
+                    )
+                )
     except Exception as e:
         if not client.is_closing:
             logger.error(f"File watcher error: {e}")
 
 
+class _ClientPool:
+    def __init__(self, watch: bool):
+        self.watch = watch
+        self.clients: dict[str, BaseLSPClient] = {}
+        self.watchers: list[asyncio.Task] = []
+        # 正在启动的客户端；同一根目录的并发 get_client 共享同一个启动任务
+        self.starting: dict[str, asyncio.Task] = {}
+
+
+_CLIENT_POOL: ContextVar[Optional[_ClientPool]] = ContextVar(
+    "codn_client_pool", default=None
+)
+
+
+@contextlib.asynccontextmanager
+async def client_pool(watch: bool = True):
+    """在上下文内按项目根目录复用 get_client 创建的客户端，退出时统一关闭。
+
+    watch 为 True 时为每个客户端启动 watch_and_sync，使文件内容保持同步。
+    """
+    pool = _ClientPool(watch)
+    token = _CLIENT_POOL.set(pool)
+    try:
+        yield pool
+    finally:
+        _CLIENT_POOL.reset(token)
+        # 等待仍在启动的客户端登记入池，以便下面统一关闭
+        await asyncio.gather(*pool.starting.values(), return_exceptions=True)
+        for watcher in pool.watchers:
+            watcher.cancel()
+        await asyncio.gather(*pool.watchers, return_exceptions=True)
+        for client in pool.clients.values():
+            await client.shutdown()
+
+
+async def _release_client(client, discard: bool = False) -> None:
+    """非池化的客户端直接关闭；池中的客户端由 client_pool() 退出时关闭。
+
+    discard 为 True 时（如客户端出错）将其移出池并立即关闭。
+    """
+    pool = _CLIENT_POOL.get()
+    if pool is not None and pool.clients.get(client.root_uri) is client:
+        if not discard:
+            return
+        del pool.clients[client.root_uri]
+    await client.shutdown()
+
+
 async def get_client(path_str: str):
+    pool = _CLIENT_POOL.get()
+    if pool is None:
+        return await _start_client(path_str)
+
+    root_uri = _resolve_root(path_str)[1]
+    client = pool.clients.get(root_uri)
+    if client is not None and not client.is_closing:
+        return client
+    task = pool.starting.get(root_uri)
+    if task is None:
+        task = asyncio.create_task(_start_client(path_str, pool))
+        pool.starting[root_uri] = task
+        task.add_done_callback(lambda _: pool.starting.pop(root_uri, None))
+    # shield：调用方被取消时启动继续进行，客户端仍会入池并在池关闭时退出，
+    # 不会留下初始化到一半的子进程
+    return await asyncio.shield(task)
+
+
+async def _start_client(path_str: str, pool: Optional[_ClientPool] = None):
     langs = detect_dominant_languages(path_str)
     if not langs:
         logger.error(f"Failed to detect dominant language for {path_str}")
         raise ValueError("Failed to detect dominant language")
     lang = langs[0]
     logger.trace(f"Detected dominant language: {lang} for path: {path_str}")
-    root_path = Path(path_str).resolve()
-    root_uri = path_to_file_uri(str(root_path))
+    root_path, root_uri, _ = _resolve_root(path_str)
     client = BaseLSPClient(root_uri)
     client.lang = lang
-    await client.start(lang)
-    logger.debug(f"Started LSP client for {lang} at {root_path}")
+    try:
+        await client.start(lang)
+        logger.debug(f"Started LSP client for {lang} at {root_path}")
+        await _open_project_files(client, path_str, root_path, lang)
+    except BaseException:
+        await client.shutdown()
+        raise
+    if pool is not None:
+        pool.clients[root_uri] = client
+        if pool.watch:
+            pool.watchers.append(asyncio.create_task(watch_and_sync(client, root_path)))
+    return client
+
+
+async def _open_project_files(client, path_str: str, root_path, lang: str) -> None:
+    """将项目内该语言的源文件逐个 didOpen 给服务端"""
     language_id = LANG_TO_LANGUAGE.get(lang, lang)
     file_ext = LANG_TO_EXTENSION.get(lang, lang)
     if lang == "c":
@@ -175,33 +410,90 @@ async def get_client(path_str: str):
     if lang == "cpp":
         file_ext = "cpp,hpp"
 
-    async for py_file in list_all_files(path_str, f"*.{file_ext}"):
-        content = py_file.read_text(encoding="utf-8")
+    paths = [p async for p in list_all_files(path_str, f"*.{file_ext}")]
+    # 文件读取放到线程池并发执行，避免逐个阻塞事件循环
+    semaphore = asyncio.Semaphore(32)
+
+    async def open_one(py_file: Path) -> None:
+        async with semaphore:
+            content = await asyncio.to_thread(py_file.read_text, encoding="utf-8")
         if not content:
-            continue
+            return
         uri = path_to_file_uri(str(py_file))
-        if not content:
-            logger.error(f"Empty file: {uri}")
         await client.send_did_open(uri, content, language_id)
-    return client
+        _get_local_path(client, uri, str(root_path))
+
+    tasks = [asyncio.create_task(open_one(p)) for p in paths]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # 任一文件失败（如非 UTF-8）即整体失败：取消其余任务并等待其结束，
+        # 避免调用方关闭客户端后它们仍向已关闭的管道发送 didOpen
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def _get_local_path(client, uri: str, str_root_path: str) -> str:
+    """uri -> 相对 root 的本地路径，按 uri 缓存在 client.local_paths"""
+    local_path = client.local_paths.get(uri)
+    if local_path is None:
+        local_path = unquote(urlparse(uri).path)[len(str_root_path) + 1 :]
+        client.local_paths[uri] = local_path
+    return local_path
+
+
+def _local_path_index(client, str_root_path: str) -> dict[str, str]:
+    """local_path -> uri 反向索引"""
+    return {
+        _get_local_path(client, uri, str_root_path): uri for uri in client.open_files
+    }
+
+
+async def _prefetch_symbols(client, uris=None, max_concurrency=20):
+    """并发预取 documentSymbol，返回 {uri: symbols}"""
+    if uris is None:
+        uris = list(client.open_files)
+    result = await client.stream_requests(
+        client.send_document_symbol,
+        [(uri,) for uri in uris],
+        max_concurrency=max_concurrency,
+        show_progress=False,
+    )
+    return {uri: symbols or [] for uri, symbols in zip(uris, result)}
+
+
+async def _get_func_index(client, uri, d_symbols, d_func_index):
+    """uri 对应的函数区间表，缺少符号时再请求 documentSymbol，结果按 uri 缓存"""
+    func_index = d_func_index.get(uri)
+    if func_index is None:
+        symbols = d_symbols.get(uri)
+        if not symbols:
+            symbols = await client.send_document_symbol(uri)
+        func_index = d_func_index[uri] = build_function_index(symbols)
+    return func_index
 
 
 async def get_snippet(entity_name=None, path_str="."):
     client = await get_client(path_str)
     l_code_snippets = []
-    for uri in client.open_files:
-        symbols = await client.send_document_symbol(uri)
+    d_symbols = await _prefetch_symbols(client)
+    for uri, symbols in d_symbols.items():
+        content = await client.read_file(uri)
+        offsets = None
 
         for sym in symbols:
             name = sym["name"]
             if entity_name and name != entity_name:
                 continue
-            content = await client.read_file(uri)
-            code_snippet = extract_symbol_code(sym, content)
+            if offsets is None:
+                offsets = _line_offsets(content)
+            code_snippet = extract_symbol_code(sym, content, line_offsets=offsets)
             # logger.trace(f"==Code Snippet:\n{code_snippet}")
             l_code_snippets.append(code_snippet)
 
-    await client.shutdown()
+    await _release_client(client)
     return l_code_snippets
 
 
@@ -223,8 +515,7 @@ async def get_funcs_for_lines(
         logger.error(f"Empty file: {full_path}")
 
     d_func_name = {}
-    root_path = Path(path_str).resolve()
-    root_uri = path_to_file_uri(str(root_path))
+    root_uri = _resolve_root(path_str)[1]
     client = BaseLSPClient(root_uri)
     await client.start(lang)
     language_id: str = LANG_TO_LANGUAGE.get(lang, lang)
@@ -247,7 +538,7 @@ async def get_funcs_for_lines(
     for sym in symbols:
         name = sym["name"]
         kind = sym["kind"]
-        if kind not in [SymbolKind.FUNCTION, SymbolKind.METHOD, SymbolKind.CLASS]:
+        if kind not in KINDS_FUNC_CLASS:
             continue
         loc = sym["location"]
         start = loc["range"]["start"]["line"]
@@ -282,18 +573,14 @@ async def get_snippets_by_line_nums(
     start, end = line_nums
     client = await get_client(path_str)
     l_code_snippets = []
-    root_path = Path(path_str).resolve()
-    str_root_path = str(root_path)
+    str_root_path = str(_resolve_root(path_str)[0])
     for uri in client.open_files:
-        local_path = unquote(urlparse(uri).path)
-        _local_path = local_path[len(str_root_path) + 1 :]
+        _local_path = _get_local_path(client, uri, str_root_path)
         if _local_path == file_path_or_pattern:
             content = await client.read_file(uri)
-            l_content = content.split("\n")
-            content = "\n".join(l_content[start:end])
-            l_code_snippets.append(content)
+            l_code_snippets.append(_slice_lines(content, start, end))
 
-    await client.shutdown()
+    await _release_client(client)
     return l_code_snippets
 
 
@@ -306,16 +593,14 @@ def match_pattern(file_path: str, patten: str) -> bool:
 
 async def get_filenames_by_pattern(path_str=".", pattern=""):
     client = await get_client(path_str)
-    root_path = Path(path_str).resolve()
-    str_root_path = str(root_path)
+    str_root_path = str(_resolve_root(path_str)[0])
 
     filenames = []
     for uri in client.open_files:
-        local_path = unquote(urlparse(uri).path)
-        _local_path = local_path[len(str_root_path) + 1 :]
+        _local_path = _get_local_path(client, uri, str_root_path)
         if pattern and not match_pattern(_local_path, pattern):
             filenames.append(_local_path)
-    await client.shutdown()
+    await _release_client(client)
     return filenames
 
 
@@ -330,14 +615,13 @@ async def get_snippets(search_terms: list[str], path_str=".", file_path_or_patte
 
     client = await get_client(path_str)
     l_code_snippets = []
-    root_path = Path(path_str).resolve()
-    str_root_path = str(root_path)
+    str_root_path = str(_resolve_root(path_str)[0])
+    if search_type in ("files", "symbols_with_file"):
+        path_to_uri = _local_path_index(client, str_root_path)
     if search_type == "files":
-        for uri in client.open_files:
-            parsed = urlparse(uri)
-            local_path = unquote(parsed.path)
-            _local_path = local_path[len(str_root_path) + 1 :]
-            if _local_path not in _search_terms:
+        for _local_path in dict.fromkeys(search_terms):
+            uri = path_to_uri.get(_local_path)
+            if uri is None:
                 continue
             if file_path_or_pattern and not match_pattern(
                 _local_path, file_path_or_pattern
@@ -347,37 +631,43 @@ async def get_snippets(search_terms: list[str], path_str=".", file_path_or_patte
             l_code_snippets.append(content)
 
     if search_type == "symbols":
+        l_uri = []
         for uri in client.open_files:
-            symbols = await client.send_document_symbol(uri)
-            parsed = urlparse(uri)
-            local_path = unquote(parsed.path)
-            _local_path = local_path[len(str_root_path) + 1 :]
+            _local_path = _get_local_path(client, uri, str_root_path)
             if file_path_or_pattern and not match_pattern(
                 _local_path, file_path_or_pattern
             ):
                 continue
+            l_uri.append(uri)
+        d_symbols = await _prefetch_symbols(client, l_uri)
+        for uri, symbols in d_symbols.items():
+            content = await client.read_file(uri)
+            offsets = None
             for sym in symbols:
                 name = sym["name"]
                 if name not in _search_terms:
                     continue
-                content = await client.read_file(uri)
-                code_snippet = extract_symbol_code(sym, content)
+                if offsets is None:
+                    offsets = _line_offsets(content)
+                code_snippet = extract_symbol_code(sym, content, line_offsets=offsets)
                 l_code_snippets.append(code_snippet)
 
     if search_type == "symbols_with_file":
-        root_path = Path(path_str).resolve()
-        str_root_path = str(root_path)
-        for uri in client.open_files:
-            symbols = await client.send_document_symbol(uri)
-            parsed = urlparse(uri)
-            local_path = unquote(parsed.path)
-            _local_path = local_path[len(str_root_path) + 1 :]
-            if _local_path not in _filenames:
+        d_local_path = {}
+        for _local_path in _filenames:
+            uri = path_to_uri.get(_local_path)
+            if uri is None:
                 continue
             if file_path_or_pattern and not match_pattern(
                 _local_path, file_path_or_pattern
             ):
                 continue
+            d_local_path[uri] = _local_path
+        d_symbols = await _prefetch_symbols(client, list(d_local_path))
+        for uri, symbols in d_symbols.items():
+            _local_path = d_local_path[uri]
+            content = await client.read_file(uri)
+            offsets = None
             for sym in symbols:
                 name = sym["name"]
                 full_name = name
@@ -387,29 +677,26 @@ async def get_snippets(search_terms: list[str], path_str=".", file_path_or_patte
                 full_name_with_file = f"{_local_path}:{full_name}"
                 if full_name_with_file not in _search_terms:
                     continue
-                content = await client.read_file(uri)
-                code_snippet = extract_symbol_code(sym, content)
+                if offsets is None:
+                    offsets = _line_offsets(content)
+                code_snippet = extract_symbol_code(sym, content, line_offsets=offsets)
                 l_code_snippets.append(code_snippet)
 
-    await client.shutdown()
+    await _release_client(client)
     return l_code_snippets
 
 
-async def _process_symbol_for_refs(sym, client, uri, root_uri, entity_name, l_done):
+async def _process_symbol_for_refs(
+    sym, client, uri, root_uri, entity_name, l_done, lines, func_index
+):
     name = sym["name"]
     if entity_name and name != entity_name:
         return None
 
     kind = sym["kind"]
-    if kind in [
-        SymbolKind.VARIABLE,
-        SymbolKind.CONSTANT,
-        SymbolKind.ENUM,
-        SymbolKind.FIELD,
-        SymbolKind.STRING,
-    ]:
+    if kind in KINDS_SKIP_IN_REFS:
         return None
-    if kind not in [SymbolKind.FUNCTION, SymbolKind.METHOD, SymbolKind.CLASS]:
+    if kind not in KINDS_FUNC_CLASS:
         raise ValueError(
             f"Unexpected kind value: {kind}, expected one of {[SymbolKind.FUNCTION, SymbolKind.METHOD, SymbolKind.CLASS]}"
         )
@@ -430,8 +717,7 @@ async def _process_symbol_for_refs(sym, client, uri, root_uri, entity_name, l_do
 
     logger.trace(f"{kind} - {full_name}")
 
-    symbols = await client.send_document_symbol(uri)
-    func_name = find_enclosing_function(symbols, func_line)
+    func_name = lookup_enclosing_function(func_index, func_line)
     if func_name != name:
         return None
 
@@ -441,14 +727,9 @@ async def _process_symbol_for_refs(sym, client, uri, root_uri, entity_name, l_do
     if l_done and f"{uri}\t{func_line}\t{func_char}" in l_done:
         return None
 
-    content = await client.read_file(uri)
-    line = "\n".join(content.split("\n")[func_line : func_line + 10])
-    _line = line
-    while _line.strip().startswith("#") or _line.strip().startswith("@"):
-        _line = "\n".join(_line.split("\n")[1:])
-
+    line = "\n".join(lines[func_line : func_line + 10])
     func_line, real_func_char = check_real_func_char(
-        _line, line, func_char, name, kind, uri, func_line
+        None, line, func_char, name, kind, uri, func_line
     )
     # assert func_line >=0
     # assert real_func_char >=0
@@ -468,71 +749,86 @@ async def get_refs(entity_name=None, path_str=".", l_done=None):
     l_refs = set()
     client = await get_client(path_str)
 
-    root_path = Path(path_str).resolve()
-    root_uri = path_to_file_uri(str(root_path))
-    len_root_uri = len(str(root_uri))
+    _, root_uri, len_root_uri = _resolve_root(path_str)
 
     n_symbols = 0
-    for uri in client.open_files:
-        if "tests/" in uri or "test_" in uri:
+    l_uri = [uri for uri in client.open_files if not SKIP_TEST_URI_RE.search(uri)]
+    d_symbols = await _prefetch_symbols(client, l_uri)
+    d_func_index = {}
+    # references 请求并发发送，最多 20 个同时在途
+    semaphore = asyncio.Semaphore(20)
+
+    async def process_one(sym, uri, lines, func_index):
+        async with semaphore:
+            return await _process_symbol_for_refs(
+                sym, client, uri, root_uri, entity_name, l_done, lines, func_index
+            )
+
+    tasks = []
+    for uri, symbols in d_symbols.items():
+        lines = (await client.read_file(uri)).split("\n")
+        func_index = d_func_index[uri] = build_function_index(symbols)
+        tasks.extend(process_one(sym, uri, lines, func_index) for sym in symbols)
+
+    for result in await asyncio.gather(*tasks):
+        if not result:
             continue
-        uri_short = uri[len_root_uri + 1 :]
-        symbols = await client.send_document_symbol(uri)
 
-        for sym in symbols:
-            result = await _process_symbol_for_refs(
-                sym, client, uri, root_uri, entity_name, l_done
-            )
-            if not result:
+        ref_result, func_name, func_line = result
+        n_symbols += 1
+        uri = ref_result[0]
+        uri_short = uri[len_root_uri + 1 :]
+        ref_result = ref_result[4]
+        if not ref_result:
+            continue
+        for i, ref in enumerate(ref_result, 1):
+            if isinstance(ref, str):  # err
                 continue
-
-            ref_result, func_name, func_line = result
-            n_symbols += 1
-            ref_result = ref_result[4]
-            if not ref_result:
+            ref_uri = ref.get("uri", "<no-uri>")
+            logger.trace(f"ref_uri {ref_uri}")
+            if SKIP_TEST_REF_RE.search(ref_uri):
                 continue
-            for i, ref in enumerate(ref_result, 1):
-                if isinstance(ref, str):  # err
-                    continue
-                ref_uri = ref.get("uri", "<no-uri>")
-                logger.trace(f"ref_uri {ref_uri}")
-                if "tests" in ref_uri or "test_" in ref_uri:
-                    continue
 
-                range_ = ref.get("range", {})
-                start = range_.get("start", {})
-                line = start.get("line", "?")
-                character = start.get("character", "?")
-                if line == "?" or character == "?":
-                    raise ValueError(
-                        f"  {i:02d}. {uri} @ Line {line}, Char {character}"
-                    )
+            range_ = ref.get("range", {})
+            start = range_.get("start", {})
+            line = start.get("line", "?")
+            character = start.get("character", "?")
+            if line == "?" or character == "?":
+                raise ValueError(f"  {i:02d}. {uri} @ Line {line}, Char {character}")
 
-                _symbols = await client.send_document_symbol(ref_uri)
-                _func_name = find_enclosing_function(_symbols, line)
+            ref_index = await _get_func_index(client, ref_uri, d_symbols, d_func_index)
+            _func_name = lookup_enclosing_function(ref_index, line)
 
-                ref_uri_short = ref_uri[len_root_uri + 1 :]
-                if _func_name is None:
-                    continue
+            ref_uri_short = ref_uri[len_root_uri + 1 :]
+            if _func_name is None:
+                continue
 
-                invoke_info = f"{ref_uri_short}:{line + 1}:{_func_name}\tinvoke\t{uri_short}:{func_line}:{func_name}"
-                if invoke_info not in l_refs:
-                    l_refs.add(invoke_info)
-                    if len(l_refs) % 1000 == 0:
-                        logger.info(f"Processed {len(l_refs)} references")
+            invoke_info = f"{ref_uri_short}:{line + 1}:{_func_name}\tinvoke\t{uri_short}:{func_line}:{func_name}"
+            if invoke_info not in l_refs:
+                l_refs.add(invoke_info)
+                if len(l_refs) % 1000 == 0:
+                    logger.info(f"Processed {len(l_refs)} references")
 
-    await client.shutdown()
+    await _release_client(client)
     logger.trace(f"n_symbols={n_symbols} l_refs={len(l_refs)}")
     return l_refs
 
 
+def _skip_comment_lines(text: str) -> str:
+    """去掉开头的注释行和装饰器行"""
+    while text.strip().startswith("#") or text.strip().startswith("@"):
+        text = "\n".join(text.split("\n")[1:])
+    return text
+
+
 def check_real_func_char(_line, line, func_char, full_name, kind, uri, func_line):
+    # _line 只用于报错信息，传 None 时在出错时才计算
     real_func_char = -1
     raw_line = line
     name_for_search = f"{full_name}("
-    if kind in [SymbolKind.FUNCTION, SymbolKind.METHOD]:
+    if kind in KINDS_FUNC:
         final_prefix = None
-        raw_first_line = raw_line.split("\n")[0]
+        raw_first_line = raw_line.partition("\n")[0]
         if name_for_search in raw_first_line:
             final_prefix = raw_first_line.index(name_for_search)
             real_func_char = final_prefix
@@ -549,15 +845,19 @@ def check_real_func_char(_line, line, func_char, full_name, kind, uri, func_line
             # raise ValueError
             if "@pytest" in raw_line:
                 return func_line, real_func_char
+            if _line is None:
+                _line = _skip_comment_lines(line)
             logger.error(
                 f"Unexpected def line={raw_line} full_name={full_name} _line={_line} uri={uri}:{func_line}"
             )
-    elif kind in [SymbolKind.CLASS]:
+    elif kind == SymbolKind.CLASS:
         if full_name in raw_line:
             final_prefix = raw_line.index(full_name)
             real_func_char = final_prefix
             if not raw_line[real_func_char:].startswith(full_name):
                 raw_first_line = repr(raw_line.split("\n")[0])
+                if _line is None:
+                    _line = _skip_comment_lines(line)
                 raise ValueError(
                     f"Unexpected class raw_first_line={raw_first_line} _line={_line} full_name={full_name} uri={uri}:{func_line}"
                 )
@@ -565,37 +865,78 @@ def check_real_func_char(_line, line, func_char, full_name, kind, uri, func_line
     return func_line, real_func_char
 
 
-async def get_all_symbols(path_str=".", entity_name=None):
-    root_path = Path(path_str).resolve()
-    root_uri = path_to_file_uri(str(root_path))
+def _symbol_cache_server_key(client) -> str:
+    """符号缓存的服务标识：语言 + 服务名 + 版本。
+
+    服务端未返回 serverInfo（如 pyright）时，用启动命令及其可执行文件的真实路径与
+    修改时间代替，升级后即不再命中旧缓存。
+    """
+    info = client.server_info
+    commands = client.config.lsp_commands.get(client.lang) or []
+    name = info.get("name") or " ".join(commands)
+    version = info.get("version")
+    if not version and commands:
+        exe = shutil.which(commands[0])
+        if exe:
+            exe = os.path.realpath(exe)
+            with contextlib.suppress(OSError):
+                version = f"{exe}@{os.stat(exe).st_mtime_ns}"
+    return f"{client.lang}:{name}:{version or ''}"
+
+
+async def get_all_symbols(path_str=".", entity_name=None, use_cache=None):
+    """use_cache 为 None 时由环境变量 CODN_SYMBOL_CACHE 决定是否启用磁盘缓存"""
+    root_uri = _resolve_root(path_str)[1]
+    if use_cache is None:
+        use_cache = cache_enabled()
 
     client = await get_client(path_str)
-    l_uri = [(uri, 1) for uri in client.open_files]
+    # 内容未变化的文件直接使用磁盘缓存中的符号，只请求其余文件
+    d_hash = {}
+    d_symbols = {}
+    symbol_cache = None
+    if use_cache:
+        symbol_cache = SymbolCache(root_uri, server=_symbol_cache_server_key(client))
+        for uri in client.open_files:
+            d_hash[uri] = content_hash(await client.read_file(uri))
+        d_symbols = symbol_cache.get_many(d_hash)
+
+    l_uri = [(uri, 1) for uri in client.open_files if uri not in d_symbols]
     result = await client.stream_requests(
         client.send_document_symbol, l_uri, max_concurrency=20, show_progress=False
     )
     if len(result) != len(l_uri):
         raise ValueError(f"Unexpected number of results: {len(result)}")
-    d_symbols = {uri[0]: symbols for uri, symbols in zip(l_uri, result)}
+    for uri, symbols in zip(l_uri, result):
+        d_symbols[uri[0]] = symbols
+    if symbol_cache is not None:
+        symbol_cache.put_many(
+            [
+                (uri[0], d_hash[uri[0]], symbols)
+                for uri, symbols in zip(l_uri, result)
+                if symbols is not None
+            ]
+        )
+        symbol_cache.close()
 
     l_params = []
     for uri in client.open_files:
+        # 与 get_refs 一致：测试文件中的符号不查 references（引用方仍用全部符号定位）
+        if SKIP_TEST_URI_RE.search(uri):
+            continue
         symbols = d_symbols[uri]
         if not symbols:
             continue
+        lines = (await client.read_file(uri)).split("\n")
 
         for sym in symbols:
             name = sym["name"]
             if entity_name and name != entity_name:
                 continue
             kind = sym["kind"]
-            if kind in l_sym_ignore:
+            if kind in SYM_IGNORE:
                 continue
-            if kind not in [
-                SymbolKind.FUNCTION,
-                SymbolKind.METHOD,
-                SymbolKind.CLASS,
-            ]:  # func method class
+            if kind not in KINDS_FUNC_CLASS:  # func method class
                 raise ValueError(f"Unexpected kind: {kind}, expected one of [12, 6, 5]")
             if name == "__init__" and "containerName" in sym:
                 continue
@@ -619,17 +960,12 @@ async def get_all_symbols(path_str=".", entity_name=None):
             if not uri.startswith(root_uri):
                 continue
             # optional: check func_char for format checking
-            content = await client.read_file(uri)
-            line = "\n".join(content.split("\n")[func_line : func_end_line + 1])
-            _line = line
-            while _line.strip().startswith("#") or _line.strip().startswith("@"):
-                _line = "\n".join(_line.split("\n")[1:])
-
+            line = "\n".join(lines[func_line : func_end_line + 1])
             if full_name == "(anonymous struct)":
                 continue
 
             func_line, real_func_char = check_real_func_char(
-                _line,
+                None,
                 line,
                 func_char,
                 name,
@@ -644,13 +980,13 @@ async def get_all_symbols(path_str=".", entity_name=None):
     return client, d_symbols, l_params
 
 
-async def get_refs_clean(entity_name=None, path_str=".", l_done=None):
+async def get_refs_clean(entity_name=None, path_str=".", l_done=None, use_cache=None):
     l_refs = set()
-    root_path = Path(path_str).resolve()
-    root_uri = path_to_file_uri(str(root_path))
-    len_root_uri = len(str(root_uri))
+    len_root_uri = _resolve_root(path_str)[2]
 
-    client, d_symbols, l_params = await get_all_symbols(path_str, entity_name)
+    client, d_symbols, l_params = await get_all_symbols(
+        path_str, entity_name, use_cache
+    )
     logger.info(f"Processed {len(d_symbols)} files, got {len(l_params)} uniq symbols.")
 
     # will timeout and stuck forever
@@ -659,31 +995,27 @@ async def get_refs_clean(entity_name=None, path_str=".", l_done=None):
     timeout = -1  # default
     if client.lang == "c":
         timeout = 1
-    l_done = set()
     results = []
-    l_params_left = l_params
-    while len(l_params_left):
-        for params in l_params_left:
+    # (uri, line, character) -> params，成功后移出，出错重启后只重试剩余部分
+    pending = {tuple(params[:3]): params for params in l_params}
+    while pending:
+        for key, params in list(pending.items()):
             try:
                 r = await client.send_references(*params, timeout=timeout)
                 results.append(r)
-                r = "\t".join([str(j) for j in r[:3]])
-                l_done.add(r)
+                del pending[key]
 
             except LSPError as e:
                 logger.error(e)
+                await _release_client(client, discard=True)
                 client, d_symbols, l_params = await get_all_symbols(
-                    path_str, entity_name
+                    path_str, entity_name, use_cache
                 )
                 break
-        l_params_left_new = []
-        for param in l_params_left:
-            r = "\t".join([str(j) for j in param[:3]])
-            if r not in l_done:
-                l_params_left_new.append(param)
-        l_params_left = l_params_left_new
-        logger.info(f"==l_params_left== {len(l_params_left)}")
+        logger.info(f"==l_params_left== {len(pending)}")
 
+    # ref_uri -> 按行排序的函数区间表，每个文件只构建一次
+    d_func_index = {}
     for uri, func_line, _, func_name, ref_result, _ in results:
         if not ref_result:
             continue
@@ -694,7 +1026,7 @@ async def get_refs_clean(entity_name=None, path_str=".", l_done=None):
                 continue
 
             ref_uri = ref.get("uri", "<no-uri>")
-            if "tests" in ref_uri or "test_" in ref_uri:
+            if SKIP_TEST_REF_RE.search(ref_uri):
                 continue
 
             range_ = ref.get("range", {})
@@ -708,15 +1040,15 @@ async def get_refs_clean(entity_name=None, path_str=".", l_done=None):
                 )
                 continue
 
-            _symbols = d_symbols.get(ref_uri)
-            if not _symbols:
-                try:
-                    _symbols = await client.send_document_symbol(ref_uri)
-                except LSPError as e:
-                    logger.debug(f"Error getting symbols for {ref_uri}: {e}")
-                    continue
+            try:
+                func_index = await _get_func_index(
+                    client, ref_uri, d_symbols, d_func_index
+                )
+            except LSPError as e:
+                logger.debug(f"Error getting symbols for {ref_uri}: {e}")
+                continue
 
-            _func_name = find_enclosing_function(_symbols, line)
+            _func_name = lookup_enclosing_function(func_index, line)
             if not _func_name:
                 continue
 
@@ -727,24 +1059,35 @@ async def get_refs_clean(entity_name=None, path_str=".", l_done=None):
                 print(invoke_info)
                 l_refs.add(invoke_info)
 
-    await client.shutdown()
+    await _release_client(client)
     logger.info(f"Processed {len(l_refs)} references.")
     return l_refs
 
 
-async def _traverse(client, len_root_uri, start_entities, root_uri):
+async def _traverse(
+    client, len_root_uri, start_entities, root_uri, d_symbols=None, d_func_index=None
+):
     str_start_entities = "|".join(start_entities)
     is_full_path = False
     clean_start_entities = []
     if ":" in str_start_entities:
         is_full_path = True
-        clean_start_entities = [
+        clean_start_entities = {
             f"{j.split(':')[0]}:{j.split(':')[2]}" for j in start_entities
-        ]
+        }
     l_refs = set()
-    for uri in client.open_files:
-        uri_short = uri[len_root_uri + 1 :]
-        symbols = await client.send_document_symbol(uri)
+    targets = []  # (uri, uri_short, func_line, func_char, real_func_char, func_name)
+    # traverse 的多层 BFS 共用同一份符号及函数区间表缓存
+    if d_symbols is None:
+        d_symbols = await _prefetch_symbols(client)
+    if d_func_index is None:
+        d_func_index = {}
+    for uri, symbols in d_symbols.items():
+        uri_short = sys.intern(uri[len_root_uri + 1 :])
+        lines = (await client.read_file(uri)).split("\n")
+        func_index = d_func_index.get(uri)
+        if func_index is None:
+            func_index = d_func_index[uri] = build_function_index(symbols)
 
         for sym in symbols:
             name = sym["name"]
@@ -758,13 +1101,9 @@ async def _traverse(client, len_root_uri, start_entities, root_uri):
                     continue
 
             kind = sym["kind"]
-            if kind in [SymbolKind.VARIABLE, SymbolKind.CONSTANT]:  # Variable Constant
+            if kind in KINDS_VARIABLE:  # Variable Constant
                 continue
-            if kind not in [
-                SymbolKind.FUNCTION,
-                SymbolKind.METHOD,
-                SymbolKind.CLASS,
-            ]:  # func method class
+            if kind not in KINDS_FUNC_CLASS:  # func method class
                 raise ValueError(
                     f"Unexpected kind value: {kind}, expected one of [12, 6, 5]"
                 )
@@ -782,7 +1121,7 @@ async def _traverse(client, len_root_uri, start_entities, root_uri):
             logger.trace(f"{kind} - {full_name}")
 
             # just check find_enclosing_function
-            func_name = find_enclosing_function(symbols, func_line)
+            func_name = lookup_enclosing_function(func_index, func_line)
             if func_name != name:
                 raise ValueError(f"Expected {name}, got {func_name}")
             if not uri.startswith(root_uri):
@@ -794,61 +1133,92 @@ async def _traverse(client, len_root_uri, start_entities, root_uri):
             #         f"func: {func_name} in {uri_short}:{func_line + 1} func_char is {func_char}"
             #     )
 
-            ref_result = None
             # logx.info(f" func: {uri}:{func_line}:{func_char}")
-            content = await client.read_file(uri)
-            line_content = "\n".join(content.split("\n")[func_line : func_line + 10])
-            _line = line_content
-            while _line.strip().startswith("#") or _line.strip().startswith("@"):
-                _line = "\n".join(_line.split("\n")[1:])
-
+            line_content = "\n".join(lines[func_line : func_line + 10])
             func_line, real_func_char = check_real_func_char(
-                _line, line_content, func_char, name, kind, uri, func_line
+                None, line_content, func_char, name, kind, uri, func_line
+            )
+            targets.append(
+                (uri, uri_short, func_line, func_char, real_func_char, func_name)
             )
 
-            if kind in [
-                SymbolKind.FUNCTION,
-                SymbolKind.METHOD,
-                SymbolKind.CLASS,
-            ]:  # func, method, class
-                ref_result = await client.send_references(
-                    uri, line=func_line, character=real_func_char
-                )
-                if not ref_result:
-                    logger.trace(
-                        f"No references found for func: {uri}:{func_line}:{func_char}"
-                    )
-                    continue
+    # 各符号的 references 请求并发发出，最多同时 10 个；
+    # 引用落在尚无函数区间表的文件时，立即开始拉取该文件符号，与其余请求重叠
+    semaphore = asyncio.Semaphore(10)
+    symbol_tasks: dict[str, asyncio.Task] = {}
 
-            if not ref_result:
-                raise ValueError(
-                    f"No references found for func: {uri}:{func_line}:{func_char} kind: {kind}"
-                )
-            for i, ref in enumerate(ref_result, 1):
-                ref_uri = ref.get("uri", "<no-uri>")
-                logger.trace(f"ref_uri {ref_uri}")
-                range_ = ref.get("range", {})
-                start = range_.get("start", {})
-                line = start.get("line", "?")
-                character = start.get("character", "?")
-                _func_name = "?"
-                if line == "?" or character == "?":
-                    raise ValueError(
-                        f"  {i:02d}. {uri} @ Line {line}, Char {character}"
-                    )
+    async def symbols_one(ref_uri):
+        async with semaphore:
+            try:
+                return await client.send_document_symbol(ref_uri) or []
+            except Exception as e:
+                logger.error(f"documentSymbol failed for {ref_uri}: {e}")
+                return []
+
+    async def refs_one(uri, func_line, real_func_char):
+        async with semaphore:
+            ref_result = await client.send_references(
+                uri, line=func_line, character=real_func_char
+            )
+        ref_result = ref_result[4]
+        for ref in ref_result or ():
+            ref_uri = ref.get("uri", "<no-uri>")
+            if (
+                ref_uri not in symbol_tasks
+                and ref_uri not in d_func_index
+                and not d_symbols.get(ref_uri)
+            ):
+                symbol_tasks[ref_uri] = asyncio.create_task(symbols_one(ref_uri))
+        return ref_result
 
-                _symbols = await client.send_document_symbol(ref_uri)
-                _func_name = find_enclosing_function(_symbols, line)
-                if not _func_name:  # TODO: import? or direct use
-                    logger.error(
-                        f"no _func_name  {i:02d}. {uri} @ Line {line}, Char {character}"
-                    )
-                    continue
-                ref_uri_short = ref_uri[len_root_uri + 1 :]
+    try:
+        l_ref_results = await asyncio.gather(
+            *(refs_one(t[0], t[2], t[4]) for t in targets)
+        )
+    except BaseException:
+        for task in symbol_tasks.values():
+            task.cancel()
+        raise
+    for ref_uri, task in symbol_tasks.items():
+        d_func_index[ref_uri] = build_function_index(await task)
+
+    for (uri, uri_short, func_line, func_char, _, func_name), ref_result in zip(
+        targets, l_ref_results
+    ):
+        if not ref_result:
+            logger.trace(f"No references found for func: {uri}:{func_line}:{func_char}")
+            continue
+        for i, ref in enumerate(ref_result, 1):
+            ref_uri = ref.get("uri", "<no-uri>")
+            logger.trace(f"ref_uri {ref_uri}")
+            range_ = ref.get("range", {})
+            start = range_.get("start", {})
+            line = start.get("line", "?")
+            character = start.get("character", "?")
+            _func_name = "?"
+            if line == "?" or character == "?":
+                raise ValueError(f"  {i:02d}. {uri} @ Line {line}, Char {character}")
 
-                invoke_info = f"{ref_uri_short}:{line + 1}:{_func_name}\tinvoke\t{uri_short}:{func_line}:{func_name}"
-                if invoke_info not in l_refs:
-                    l_refs.add(invoke_info)
+            ref_index = await _get_func_index(client, ref_uri, d_symbols, d_func_index)
+            _func_name = lookup_enclosing_function(ref_index, line)
+            if not _func_name:  # TODO: import? or direct use
+                logger.error(
+                    f"no _func_name  {i:02d}. {uri} @ Line {line}, Char {character}"
+                )
+                continue
+            ref_uri_short = sys.intern(ref_uri[len_root_uri + 1 :])
+
+            # 先存元组，由 traverse 统一格式化
+            l_refs.add(
+                (
+                    ref_uri_short,
+                    line + 1,
+                    _func_name,
+                    uri_short,
+                    func_line,
+                    func_name,
+                )
+            )
     return l_refs
 
 
@@ -859,43 +1229,53 @@ async def traverse(
     direction,
     traversal_depth,
     path_str=".",
+    client=None,
 ):
     # 暂时无视 entity_type_filter dependency_type_filter
+    # 传入 client 时由调用方负责关闭
     l_refs = set()
-    client = await get_client(path_str)
-    root_path = Path(path_str).resolve()
-    root_uri = path_to_file_uri(str(root_path))
-    len_root_uri = len(str(root_uri))
+    owned = client is None
+    if owned:
+        client = await get_client(path_str)
+    _, root_uri, len_root_uri = _resolve_root(path_str)
 
     if direction == "downstream":
-        current_depth = 1
-        todo = []
-        if traversal_depth >= current_depth:
-            _l_refs = await _traverse(client, len_root_uri, start_entities, root_uri)
-            for i in list(_l_refs):
-                l_refs.add(i)
-                a = i.split("\t")[0]
-                z = a.split(":")[-1]
-                if z != "None":
-                    todo.append(a)
-        current_depth = 2
-        while traversal_depth >= current_depth:
-            _l_refs = await _traverse(client, len_root_uri, todo, root_uri)
-            for i in list(_l_refs):
-                l_refs.add(i)
-                a = i.split("\t")[0]
-                z = a.split(":")[-1]
-                if z != "None":
-                    todo.append(a)
-            current_depth += 1
+        d_symbols = await _prefetch_symbols(client)
+        d_func_index = {}
+        # 按层 BFS：每层只展开新发现的调用方，已展开的不再重复请求
+        visited = set(start_entities)
+        seen_callers = set()
+        frontier = list(start_entities)
+        for depth in range(1, traversal_depth + 1):
+            # start_entities 为空时第一层展开全部符号；之后没有新调用方即结束
+            if not frontier and depth > 1:
+                break
+            _l_refs = await _traverse(
+                client, len_root_uri, frontier, root_uri, d_symbols, d_func_index
+            )
+            next_frontier = []
+            for ref in _l_refs:
+                l_refs.add(ref)
+                caller_key = ref[:3]
+                if caller_key in seen_callers or caller_key[2] == "None":
+                    continue
+                seen_callers.add(caller_key)
+                caller = "{}:{}:{}".format(*caller_key)
+                if caller not in visited:
+                    visited.add(caller)
+                    next_frontier.append(caller)
+            frontier = next_frontier
 
-    await client.shutdown()
-    return list(l_refs)
+    if owned:
+        await _release_client(client)
+    return ["{}:{}:{}\tinvoke\t{}:{}:{}".format(*ref) for ref in l_refs]
 
 
-async def get_called(path_str):
+async def get_called(path_str, client=None):
     l_refs = set()
-    client = await get_client(path_str)
+    owned = client is None
+    if owned:
+        client = await get_client(path_str)
     file_uris = [uri for uri in client.open_files]
     analyzer = CallGraphAnalyzer(client)
     call_graph = await analyzer.analyze_project(file_uris)
@@ -903,17 +1283,26 @@ async def get_called(path_str):
     for caller, callees in call_graph.items():
         # print(f"{caller} called: {', '.join(callees)}")
         for callee in callees:
-            r = "\t".join([caller, "called", callee])
-            l_refs.add(r)
-    return l_refs
+            l_refs.add((caller, callee))
+    if owned:
+        await _release_client(client)
+    return {f"{caller}\tcalled\t{callee}" for caller, callee in l_refs}
+
+
+_CALL_RE = re.compile(r"(\w+)\s*\(")
+_PY_KEYWORDS = frozenset(keyword.kwlist)
+_WORD_RE = re.compile(r"\w+")
 
 
 class CallGraphAnalyzer:
     def __init__(self, client: BaseLSPClient):
         self.client = client  # 你的LSP客户端实例
 
-    async def analyze_project(self, file_uris: list[str]) -> dict[str, list[str]]:
-        call_graph: dict[str, list[str]] = {}
+    async def analyze_project(
+        self, file_uris: list[str], project_only: bool = False
+    ) -> dict[str, list[str]]:
+        """project_only=True 时只保留项目内定义过的名字，跳过内置/三方调用的 definition 查询"""
+        call_graph: defaultdict[str, list[str]] = defaultdict(list)
 
         l_uri = [(uri,) for uri in file_uris]
         results = await self.client.stream_requests(
@@ -922,8 +1311,16 @@ class CallGraphAnalyzer:
         if len(results) != len(l_uri):
             raise ValueError(f"Unexpected number of results: {len(results)}")
         d_symbols = {uri[0]: symbols for uri, symbols in zip(l_uri, results)}
-
-        set_params = set()
+        project_names = None
+        if project_only:
+            project_names = {
+                s["name"]
+                for syms in d_symbols.values()
+                for s in syms or []
+                if s.get("kind") in KINDS_FUNC_CLASS
+            }
+
+        seen_params: dict[tuple, None] = {}  # 去重且保持插入顺序
         l_params = []
         l_meta = []
         for uri in file_uris:
@@ -932,59 +1329,79 @@ class CallGraphAnalyzer:
             symbols = d_symbols[uri]
             # 2. 读取文件内容
             text = await self.client.read_file(uri)
+            # 每个文件只拆分一次行，按行号切片取函数体（同 extract_code）
+            text_lines = text.splitlines()
             # 3. 遍历函数符号，提取调用关系
             for sym in symbols:
-                if sym["kind"] in [SymbolKind.FUNCTION, SymbolKind.METHOD]:
+                if sym["kind"] in KINDS_FUNC:
                     caller_name = sym["name"]
                     caller_range = sym["location"]["range"]
                     start_line = caller_range["start"]["line"]
                     end_line = caller_range["end"]["line"]
-                    func_body = extract_code(text, start_line, end_line)
+                    body_lines = text_lines[start_line : end_line + 1]
+                    func_body = "\n".join(body_lines)
                     # 4. 找调用的函数名（简单用正则，示例为 Python 调用）
                     called_names = self._find_called_functions(func_body)
+                    # 每个函数体只扫描一次，按整词记录首次出现位置
+                    d_pos = _first_word_positions(body_lines)
 
                     for name in called_names:  # 5. 查询调用定义
-                        d_params = position_for_name(func_body, name, start_line)
-                        line = d_params["line"]
-                        character = d_params["character"]
+                        if project_names is not None and name not in project_names:
+                            continue
+                        pos = d_pos.get(name)
+                        if pos is None:
+                            line, character = -1, -1
+                        else:
+                            line, character = pos[0] + start_line, pos[1]
                         # r = '\t'.join([uri, str(line), str(character)])
-                        r = tuple([uri, line, character])
-                        if r not in set_params:
-                            set_params.add(r)
-                        l_params.append((uri, line, character))
+                        r = (uri, line, character)
+                        seen_params.setdefault(r, None)
+                        l_params.append(r)
                         l_meta.append([name, caller_name, caller_range])
 
-        logger.debug(f"before {len(l_params)}; after {len(set_params)}")
-        l_set_params = list(set_params)
+        logger.debug(f"before {len(l_params)}; after {len(seen_params)}")
+        keys = list(seen_params)
         locations = await self.client.stream_requests(
-            self.client.send_definition, l_set_params, max_concurrency=10
+            self.client.send_definition, keys, max_concurrency=10
         )
-        d_cached_loc = {}
-        for params, location in zip(l_set_params, locations):
-            d_cached_loc[params] = location
+        d_cached_loc = dict(zip(keys, locations))
 
         for meta, params in zip(l_meta, l_params):
             location = d_cached_loc[params]
             if location:
                 name = meta[0]
                 caller_name = meta[1]
-                if caller_name not in call_graph:
-                    call_graph[caller_name] = []
                 call_graph[caller_name].append(name)
 
-        return call_graph
+        return dict(call_graph)
 
     def _find_called_functions(self, code: str) -> list[str]:
-        # 简单示例用正则匹配函数调用：foo(...)，忽略复杂语法
-        pattern = r"(\w+)\s*\("
-        return re.findall(pattern, code)[1:]
+        # 简单示例用正则匹配函数调用：foo(...)，忽略复杂语法；跳过 if (...) 之类的关键字
+        return [m for m in _CALL_RE.findall(code)[1:] if m not in _PY_KEYWORDS]
 
 
 def position_for_name(code: str, name: str, start_line: int) -> dict[str, int]:
     # TODO 目前只是简单返回第一个找到调用名字的位置
-    lines = code.splitlines()
+    return position_for_name_in_lines(code.splitlines(), name, start_line)
+
+
+def position_for_name_in_lines(
+    lines: list[str], name: str, start_line: int
+) -> dict[str, int]:
+    """同 position_for_name，传入已拆分的行，避免重复 splitlines"""
+    # 按整词匹配，避免 log 命中 logger 之类的子串
+    pat = re.compile(rf"\b{re.escape(name)}\b")
     for lineno, line in enumerate(lines):
-        col = line.find(name)
-        if col >= 0:
-            return {"line": lineno + start_line, "character": col}
+        m = pat.search(line)
+        if m:
+            return {"line": lineno + start_line, "character": m.start()}
     return {"line": -1, "character": -1}
+
+
+def _first_word_positions(lines: list[str]) -> dict[str, tuple[int, int]]:
+    """{单词: (行号, 列号)}，只记录每个单词首次出现的位置"""
+    d_pos: dict[str, tuple[int, int]] = {}
+    for lineno, line in enumerate(lines):
+        for m in _WORD_RE.finditer(line):
+            d_pos.setdefault(m.group(), (lineno, m.start()))
+    return d_pos
@@ -1,15 +1,106 @@
 import asyncio
+import functools
 import json
+import sys
 import time
 from dataclasses import dataclass, field
 from enum import Enum
-from itertools import count
-from typing import Any, Optional
+from itertools import count, islice
+from typing import Any, Optional, Union
 from typing import Callable, Awaitable, Tuple
 from loguru import logger
-from asyncio import Semaphore, Queue, create_task, gather
+from asyncio import create_task
+
+try:
+    import orjson
+except ImportError:  # 可选依赖，未安装时使用标准库 json
+    orjson = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 DEFAULT_TIMEOUT = 30
+STREAM_LIMIT = 2**20  # StreamReader 缓冲上限，默认 64KiB 对大响应偏小
+PIPE_SIZE = 2**20  # Linux 管道缓冲区，默认 64KiB，服务端批量输出时容易阻塞
+F_SETPIPE_SZ = getattr(fcntl, "F_SETPIPE_SZ", 1031)
+
+
+def _json_dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
+
+
+def _json_loads(data: Union[bytes, bytearray]) -> Any:
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass  # 非法 UTF-8 等情况，交给下面的标准库处理
+    try:
+        return json.loads(data)  # 直接解析字节，不再整体转码
+    except UnicodeDecodeError:
+        # 违反协议的非 UTF-8 内容：记录后按替换字符兜底，避免请求一直等到超时
+        logger.warning("LSP message body is not valid UTF-8")
+        return json.loads(data.decode("utf-8", errors="replace"))
+
+
+def _set_pipe_size(pipe_transport: Any, size: int = PIPE_SIZE) -> None:
+    """放大子进程管道的内核缓冲区，仅 Linux 有效，失败时保持默认大小."""
+    if fcntl is None or not sys.platform.startswith("linux") or not pipe_transport:
+        return
+    try:
+        fd = pipe_transport.get_extra_info("pipe").fileno()
+        try:
+            fcntl.fcntl(fd, F_SETPIPE_SZ, size)
+        except PermissionError:  # 超过 pipe-max-size 时按系统上限设置
+            with open("/proc/sys/fs/pipe-max-size") as f:
+                fcntl.fcntl(fd, F_SETPIPE_SZ, min(size, int(f.read())))
+    except Exception as e:
+        logger.trace(f"Failed to set pipe size: {e}")
+
+
+def _format_progress(completed: int, total: int, elapsed: float) -> str:
+    speed = completed / elapsed if elapsed > 0 else 0
+    percent = (completed / total) * 100
+    eta = (total - completed) / speed if speed > 0 else float("inf")
+    return (
+        f"Progress: {completed}/{total} ({percent:.1f}%) "
+        f"| Elapsed: {elapsed:.1f}s "
+        f"| Speed: {speed:.2f}/s "
+        f"| ETA: {eta:.1f}s"
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _message_head(method: str) -> bytes:
+    """请求/通知中 params 之前的固定部分，按 method 缓存序列化结果."""
+    return b'{"jsonrpc":"2.0","method":' + _json_dumps(method) + b',"params":'
+
+
+# initialize 时声明的客户端能力，内容固定，只构建一次
+_CLIENT_CAPABILITIES: dict[str, Any] = {
+    "textDocument": {
+        "synchronization": {
+            "dynamicRegistration": True,
+            "willSave": True,
+            "didSave": True,
+        },
+        "completion": {"dynamicRegistration": True},
+        "hover": {"dynamicRegistration": True},
+        "definition": {"dynamicRegistration": True},
+        "references": {"dynamicRegistration": True},
+        "documentSymbol": {"dynamicRegistration": True},
+    },
+    "workspace": {
+        "applyEdit": True,
+        "workspaceEdit": {"documentChanges": True},
+        "didChangeConfiguration": {"dynamicRegistration": True},
+        "didChangeWatchedFiles": {"dynamicRegistration": True},
+    },
+}
 
 
 class LSPError(Exception):
@@ -44,9 +135,19 @@ class BaseLSPClient:
         self.root_uri = root_uri
         self.config = config or LSPConfig()
         self._msg_id = count(1)
-        self._lock = asyncio.Lock()
+        # 文件状态（open/change/close）按 uri 加锁：同一文件的通知保持顺序，不同文件互不阻塞
+        self._file_locks: dict[str, asyncio.Lock] = {}
+        # _pending 只在事件循环线程内读写，各操作之间没有 await，不需要加锁
         self._pending: dict[int, asyncio.Future[Any]] = {}
         self._tasks: set[asyncio.Task[Any]] = set()  # 当任务返回类型不确定时
+        # 服务端通知按 method 分派，可按需注册额外的处理函数
+        self._notification_handlers: dict[
+            str, Callable[[dict[str, Any]], Awaitable[None]]
+        ] = {
+            "textDocument/publishDiagnostics": self._handle_diagnostics,
+            "window/logMessage": self._handle_log_message,
+            "window/showMessage": self._handle_show_message,
+        }
         self._shutdown_event = asyncio.Event()
         self._state = LSPClientState.STOPPED
         self.proc: Optional[asyncio.subprocess.Process] = None
@@ -54,6 +155,8 @@ class BaseLSPClient:
         self.open_files: set[str] = set()
         self.file_versions: dict[str, int] = {}
         self.file_states: dict[str, dict[str, Any]] = {}
+        self.local_paths: dict[str, str] = {}  # uri -> 相对项目根目录的路径缓存
+        self.server_info: dict[str, Any] = {}
 
     @property
     def state(self) -> LSPClientState:
@@ -89,7 +192,12 @@ class BaseLSPClient:
                 stdin=asyncio.subprocess.PIPE,
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE,
+                limit=STREAM_LIMIT,
             )
+            transport = getattr(self.proc, "_transport", None)
+            if transport is not None:
+                for fd in (0, 1):  # stdin 批量 didOpen，stdout 批量响应
+                    _set_pipe_size(transport.get_pipe_transport(fd))
             task = asyncio.create_task(self._response_loop())
             self._tasks.add(task)
             task.add_done_callback(self._tasks.discard)
@@ -102,38 +210,29 @@ class BaseLSPClient:
         init_params = {
             "processId": None,
             "rootUri": self.root_uri,
-            "capabilities": {
-                "textDocument": {
-                    "synchronization": {
-                        "dynamicRegistration": True,
-                        "willSave": True,
-                        "didSave": True,
-                    },
-                    "completion": {"dynamicRegistration": True},
-                    "hover": {"dynamicRegistration": True},
-                    "definition": {"dynamicRegistration": True},
-                    "references": {"dynamicRegistration": True},
-                    "documentSymbol": {"dynamicRegistration": True},
-                },
-                "workspace": {
-                    "applyEdit": True,
-                    "workspaceEdit": {"documentChanges": True},
-                    "didChangeConfiguration": {"dynamicRegistration": True},
-                    "didChangeWatchedFiles": {"dynamicRegistration": True},
-                },
-            },
+            "capabilities": _CLIENT_CAPABILITIES,
             "workspaceFolders": [{"uri": self.root_uri, "name": "workspace"}],
         }
-        await self._request("initialize", init_params)
+        result = await self._request("initialize", init_params)
+        # serverInfo 为可选字段：{"name": ..., "version": ...}
+        self.server_info = (result or {}).get("serverInfo") or {}
         await self._notify("initialized", {})
 
     async def _send(self, msg: dict[str, Any]) -> None:
+        try:
+            data = _json_dumps(msg)
+        except Exception as e:
+            raise LSPError(f"Failed to send message: {e}") from e
+        await self._send_raw(data)
+
+    async def _send_raw(self, *parts: bytes) -> None:
+        """发送已序列化的消息体（可分段传入），补上 Content-Length 头."""
         if not self.proc or not self.proc.stdin:
             raise LSPError("LSP process not available")
         try:
-            data = json.dumps(msg).encode("utf-8")
-            header = f"Content-Length: {len(data)}\r\n\r\n".encode()
-            self.proc.stdin.write(header + data)
+            header = b"Content-Length: %d\r\n\r\n" % sum(map(len, parts))
+            # 头部与各段只拼接一次；writelines 在管道传输上同样是先 join 再 write
+            self.proc.stdin.write(b"".join((header, *parts)))
             await self.proc.stdin.drain()
         except Exception as e:
             raise LSPError(f"Failed to send message: {e}") from e
@@ -147,14 +246,18 @@ class BaseLSPClient:
             raise LSPError(f"Cannot send request in state: {self._state}")
 
         msg_id = next(self._msg_id)
-        future: asyncio.Future[Any] = asyncio.Future()
+        future: asyncio.Future[Any] = asyncio.get_running_loop().create_future()
 
-        async with self._lock:
-            self._pending[msg_id] = future
+        self._pending[msg_id] = future
 
         try:
-            await self._send(
-                {"jsonrpc": "2.0", "id": msg_id, "method": method, "params": params},
+            # 与 _notify 相同：只序列化 params，外层结构和 id 直接拼接字节
+            try:
+                params_data = _json_dumps(params)
+            except Exception as e:
+                raise LSPError(f"Failed to send message: {e}") from e
+            await self._send_raw(
+                _message_head(method), params_data, b',"id":%d}' % msg_id
             )
             result: dict[str, Any] = await asyncio.wait_for(future, timeout=timeout)
             if "error" in result:
@@ -170,14 +273,18 @@ class BaseLSPClient:
                 raise
             raise LSPError(f"Request {method} failed: {e}") from e
         finally:
-            async with self._lock:
-                self._pending.pop(msg_id, None)
+            self._pending.pop(msg_id, None)
 
     async def _notify(self, method: str, params: dict[str, Any]) -> None:
         if self._state not in (LSPClientState.RUNNING, LSPClientState.STARTING):
             if method not in ("initialized", "exit"):
                 raise LSPError(f"Cannot send notification in state: {self._state}")
-        await self._send({"jsonrpc": "2.0", "method": method, "params": params})
+        # 只序列化 params，外层结构使用缓存
+        try:
+            params_data = _json_dumps(params)
+        except Exception as e:
+            raise LSPError(f"Failed to send message: {e}") from e
+        await self._send_raw(_message_head(method), params_data, b"}")
 
     async def _response_loop(self) -> None:
         try:
@@ -194,10 +301,7 @@ class BaseLSPClient:
                     )
                     raise LSPError("LSP process crashed")
                 try:
-                    headers = await self._read_headers()
-                    if not headers:
-                        continue
-                    content_length = int(headers.get("Content-Length", 0))
+                    content_length = await self._read_content_length()
                     if content_length > 0:
                         message = await self._read_body(content_length)
                         if message:
@@ -214,57 +318,44 @@ class BaseLSPClient:
             if not self._shutdown_event.is_set():
                 logger.error(f"Fatal response loop error: {e}")
 
-    async def _read_headers(self) -> dict[str, str]:
-        """读取并解析 HTTP 头部，返回键值对字典."""
-        headers: dict[str, str] = {}  # 显式声明类型
+    async def _read_content_length(self) -> int:
+        """读取一帧的头部，只解析 Content-Length（不区分大小写），缺失时返回 0."""
+        content_length = 0
         while True:
             line = await self._read_line()
             if not line or line == b"\r\n":
                 break
-            try:
-                decoded = line.decode("utf-8", errors="replace").strip()
-                if ":" in decoded:
-                    key, value = decoded.split(":", 1)
-                    headers[key.strip()] = value.strip()
-            except Exception as e:
-                logger.warning(f"Failed to parse header line: {e}")
-        return headers
+            if line[:15].lower() == b"content-length:":
+                content_length = int(line[15:])
+        return content_length
 
     async def _read_line(self) -> bytes:
         if not self.proc or not self.proc.stdout:
             return b""
-        line = bytearray()
         try:
-            while True:
-                char = await self.proc.stdout.read(1)
-                if not char:
-                    break
-                line.extend(char)
-                if line.endswith(b"\r\n"):
-                    break
+            return await self.proc.stdout.readuntil(b"\r\n")
+        except asyncio.IncompleteReadError as e:  # 流结束，返回已读到的部分
+            return e.partial
         except Exception as e:
             logger.trace(f"Error reading line: {e}")
-        return bytes(line)
+        return b""
 
     async def _read_body(self, length: int) -> Optional[dict[str, Any]]:
         if not self.proc or not self.proc.stdout:
             return None
 
-        data = bytearray()
-        remaining = length
         try:
-            while remaining > 0:
-                chunk = await self.proc.stdout.read(remaining)
-                if not chunk:  # 流结束或读取失败
-                    break
-                data.extend(chunk)
-                remaining -= len(chunk)
-
-            if len(data) != length:
-                logger.error(f"Expected {length} bytes but got {len(data)} bytes")
-                return None
+            # 一次从 StreamReader 缓冲区取出整个消息体，不再分块拼接
+            data = await self.proc.stdout.readexactly(length)
+        except asyncio.IncompleteReadError as e:  # 流提前结束
+            logger.error(f"Expected {length} bytes but got {len(e.partial)} bytes")
+            return None
+        except Exception as e:
+            logger.error(f"Failed to read message body: {e}")
+            return None
 
-            return json.loads(data.decode("utf-8", errors="replace"))
+        try:
+            return _json_loads(data)
         except json.JSONDecodeError as e:
             logger.error(f"Failed to parse JSON message: {e}")
             return None
@@ -275,23 +366,14 @@ class BaseLSPClient:
     async def _handle_message(self, msg: dict[str, Any]) -> None:
         try:
             if msg_id := msg.get("id"):
-                async with self._lock:
-                    if future := self._pending.get(msg_id):
-                        if not future.done():
-                            future.set_result(msg)
-                        return
-
-            method = msg.get("method")
-            if not method:
-                return
+                if future := self._pending.get(msg_id):
+                    if not future.done():
+                        future.set_result(msg)
+                    return
 
-            params = msg.get("params", {})
-            if method == "textDocument/publishDiagnostics":
-                await self._handle_diagnostics(params)
-            elif method == "window/logMessage":
-                await self._handle_log_message(params)
-            elif method == "window/showMessage":
-                await self._handle_show_message(params)
+            handler = self._notification_handlers.get(msg.get("method"))
+            if handler:
+                await handler(msg.get("params", {}))
         except Exception as e:
             logger.error(f"Error handling message: {e}")
 
@@ -329,48 +411,54 @@ class BaseLSPClient:
         language_id: str = "",
     ) -> None:
         """Unified file state management."""
-        async with self._lock:
-            if action == "open":
-                self.file_states[uri] = {
-                    "content": content,
-                    "language_id": language_id,
-                    "status": "open",
-                }
+        lock = self._file_locks.get(uri)
+        if lock is None:
+            lock = self._file_locks[uri] = asyncio.Lock()
+        async with lock:
+            if (
+                action in ("open", "change")
+                and uri in self.open_files
+                and self.file_states.get(uri, {}).get("content") == content
+            ):
+                return  # 服务端已有相同内容，跳过 didChange（如无修改的保存、重复事件）
+            if action == "change" and uri not in self.open_files:
+                # 尚未打开的文件改为 didOpen（锁不可重入，不能递归调用）
+                action = "open"
+            if action == "close":
                 if uri in self.open_files:
-                    self.file_versions[uri] = self.file_versions.get(uri, 0) + 1
+                    self.open_files.remove(uri)
+                    self.file_versions.pop(uri, None)
                     await self._notify(
-                        "textDocument/didChange",
-                        {
-                            "textDocument": {
-                                "uri": uri,
-                                "version": self.file_versions[uri],
-                            },
-                            "contentChanges": [{"text": content}],
-                        },
+                        "textDocument/didClose",
+                        {"textDocument": {"uri": uri}},
                     )
-                    return
-                self.open_files.add(uri)
-                self.file_versions[uri] = 1
-                await self._notify(
-                    "textDocument/didOpen",
-                    {
-                        "textDocument": {
-                            "uri": uri,
-                            "languageId": language_id,
-                            "version": 1,
-                            "text": content,
-                        },
-                    },
-                )
-            elif action == "change":
-                self.file_states[uri] = {
-                    "content": content,
-                    "language_id": language_id,
-                    "status": "change",
-                }
-                if uri not in self.open_files:
-                    await self._manage_file_state(uri, "open", content)
-                    return
+                return
+            prev_state = self.file_states.get(uri)
+            opened = uri not in self.open_files
+            try:
+                await self._send_file_state(uri, action, content, language_id)
+            except BaseException:
+                # 发送失败：恢复先前记录的内容，否则重试相同内容时会被上面的判断跳过
+                if prev_state is None:
+                    self.file_states.pop(uri, None)
+                else:
+                    self.file_states[uri] = prev_state
+                if opened:  # didOpen 未送达，服务端并未打开该文件
+                    self.open_files.discard(uri)
+                    self.file_versions.pop(uri, None)
+                raise
+
+    async def _send_file_state(
+        self, uri: str, action: str, content: str, language_id: str
+    ) -> None:
+        """记录 open/change 后的文件内容并发送对应通知（调用方持有该 uri 的锁）."""
+        if action == "open":
+            self.file_states[uri] = {
+                "content": content,
+                "language_id": language_id,
+                "status": "open",
+            }
+            if uri in self.open_files:
                 self.file_versions[uri] = self.file_versions.get(uri, 0) + 1
                 await self._notify(
                     "textDocument/didChange",
@@ -382,14 +470,37 @@ class BaseLSPClient:
                         "contentChanges": [{"text": content}],
                     },
                 )
-            elif action == "close":
-                if uri in self.open_files:
-                    self.open_files.remove(uri)
-                    self.file_versions.pop(uri, None)
-                    await self._notify(
-                        "textDocument/didClose",
-                        {"textDocument": {"uri": uri}},
-                    )
+                return
+            self.open_files.add(uri)
+            self.file_versions[uri] = 1
+            await self._notify(
+                "textDocument/didOpen",
+                {
+                    "textDocument": {
+                        "uri": uri,
+                        "languageId": language_id,
+                        "version": 1,
+                        "text": content,
+                    },
+                },
+            )
+        elif action == "change":
+            self.file_states[uri] = {
+                "content": content,
+                "language_id": language_id,
+                "status": "change",
+            }
+            self.file_versions[uri] = self.file_versions.get(uri, 0) + 1
+            await self._notify(
+                "textDocument/didChange",
+                {
+                    "textDocument": {
+                        "uri": uri,
+                        "version": self.file_versions[uri],
+                    },
+                    "contentChanges": [{"text": content}],
+                },
+            )
 
     async def read_file(self, uri: str) -> str:
         """根据uri读取当前缓存的文件内容，如果文件不存在或未打开，返回None。"""
@@ -421,51 +532,51 @@ class BaseLSPClient:
         progress_interval: float = 1.0,  # 最小打印间隔（秒）
     ) -> list[Any]:
         total = len(args_list)
-        semaphore = Semaphore(max_concurrency)
-        queue: Queue[Tuple[int, Any]] = Queue()
         results = [None] * total
         completed = 0
         last_print_time = time.perf_counter()
         start_time = last_print_time
         # printed = False
 
-        async def worker(index: int, args: Tuple[Any, ...]):
-            async with semaphore:
-                try:
-                    result = await method(*args)
-                    await queue.put((index, result))
-                except Exception as e:
-                    logger.error(f"Request failed at index {index}: {e}")
-                    await queue.put((index, None))
-
-        tasks = [create_task(worker(i, args)) for i, args in enumerate(args_list)]
-
-        for _ in range(total):
-            index, result = await queue.get()
-            results[index] = result
-            completed += 1
-
-            if show_progress:
-                now = time.perf_counter()
-                if (
-                    completed % progress_every == 0
-                    or (now - last_print_time) >= progress_interval
-                ):
-                    elapsed = now - start_time
-                    speed = completed / elapsed if elapsed > 0 else 0
-                    percent = (completed / total) * 100
-                    eta = (total - completed) / speed if speed > 0 else float("inf")
-                    logger.info(
-                        f"Progress: {completed}/{total} ({percent:.1f}%) "
-                        f"| Elapsed: {elapsed:.1f}s "
-                        f"| Speed: {speed:.2f}/s "
-                        f"| ETA: {eta:.1f}s",
-                        end="\n",
-                        flush=True,
-                    )
-                    last_print_time = now
+        async def worker(index: int, args: Tuple[Any, ...]) -> Tuple[int, Any]:
+            try:
+                return index, await method(*args)
+            except Exception as e:
+                logger.error(f"Request failed at index {index}: {e}")
+                return index, None
+
+        # 最多同时创建 max_concurrency 个任务，完成一个再补一个，
+        # 按完成顺序收集结果，按 index 写回保持输入顺序
+        todo = iter(enumerate(args_list))
+        pending = {create_task(worker(i, a)) for i, a in islice(todo, max_concurrency)}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    index, result = task.result()
+                    results[index] = result
+                    completed += 1
+                    for i, a in islice(todo, 1):
+                        pending.add(create_task(worker(i, a)))
+
+                    # 每 progress_every 个才取一次时间，距上次打印超过 progress_interval 才打印
+                    if show_progress and completed % progress_every == 0:
+                        now = time.perf_counter()
+                        if now - last_print_time >= progress_interval:
+                            logger.opt(lazy=True).info(
+                                "{}",
+                                lambda c=completed, e=now - start_time: (
+                                    _format_progress(c, total, e)
+                                ),
+                            )
+                            last_print_time = now
+        except BaseException:
+            for task in pending:
+                task.cancel()
+            raise
 
-        await gather(*tasks, return_exceptions=True)
         return results
 
     async def batch_requests(
@@ -553,11 +664,10 @@ class BaseLSPClient:
         try:
             self._shutdown_event.set()
 
-            async with self._lock:
-                for future in self._pending.values():
-                    if not future.done():
-                        future.cancel()
-                self._pending.clear()
+            for future in list(self._pending.values()):
+                if not future.done():
+                    future.cancel()
+            self._pending.clear()
 
             if self.proc and self.state not in {
                 LSPClientState.STOPPING,
@@ -632,5 +742,5 @@ class BaseLSPClient:
         # 清理状态
         self.open_files.clear()
         self.file_versions.clear()
-        async with self._lock:
-            self._pending.clear()
+        self._file_locks.clear()
+        self._pending.clear()
@@ -1,4 +1,8 @@
+import functools
 import re
+from bisect import bisect_right
+from collections.abc import Mapping
+from types import MappingProxyType
 from typing import Any, Optional
 from loguru import logger
 
@@ -36,45 +40,123 @@ def kind_to_str(kind: int) -> str:
     return SYMBOL_KIND_MAP.get(kind, f"Unknown({kind})")
 
 
+@functools.lru_cache(maxsize=32)
+def _split_lines(text: str) -> tuple[str, ...]:
+    """同一文本反复调用 extract_code 等时只拆分一次；返回元组，调用方不能修改"""
+    return tuple(text.splitlines())
+
+
 def extract_code(text: str, start_line: int, end_line: int) -> str:
-    lines = text.splitlines()
+    lines = _split_lines(text)
     return "\n".join(lines[start_line : end_line + 1])
 
 
+_FUNC_KINDS = frozenset((5, 6, 12))  # Class Method Function
+# 只读的共享默认值，避免 .get(k, {}) 每次新建空字典
+_EMPTY: Mapping[str, Any] = MappingProxyType({})
+
+
 def find_enclosing_function(
     symbols: list[dict[str, Any]],
     line: int,
 ) -> Optional[str]:
-    def _search_symbols(syms: list[dict[str, Any]]) -> Optional[str]:
-        result = None
-        for symbol in syms:
-            if symbol.get("kind") in (5, 6, 12):  # Function Method
-                rng = symbol.get("location", {}).get("range", {})
-                start_line = rng.get("start", {}).get("line", -1)
-                end_line = rng.get("end", {}).get("line", -1)
+    # 迭代展开，避免逐层递归调用；结果与递归写法一致：
+    # 同层后出现的匹配覆盖前面的，子树中的非空结果覆盖父节点
+    end = object()
+    result = None
+    stack = []  # (父层剩余兄弟节点, 父层当前结果)
+    it = iter(symbols)
+    try:
+        while True:
+            symbol = next(it, end)
+            if symbol is end:
+                if not stack:
+                    return result
+                it, parent_result = stack.pop()
+                result = result or parent_result
+                continue
+
+            if symbol.get("kind") in _FUNC_KINDS:
+                rng = symbol.get("location", _EMPTY).get("range", _EMPTY)
+                start_line = rng.get("start", _EMPTY).get("line", -1)
+                end_line = rng.get("end", _EMPTY).get("line", -1)
                 if start_line <= line <= end_line:
                     result = symbol.get("name", "")
 
-            children = symbol.get("children", [])
+            children = symbol.get("children")
             if children:
-                nested_result = _search_symbols(children)
-                if nested_result:
-                    result = nested_result
-        return result
-
-    try:
-        return _search_symbols(symbols)
+                stack.append((it, result))
+                it = iter(children)
+                result = None
     except Exception as e:
         logger.trace(f"Error finding enclosing function: {e}")
         return None
 
 
+def build_function_index(
+    symbols: list[dict[str, Any]],
+) -> tuple[list[int], list[Optional[str]]]:
+    """预先展开 find_enclosing_function 的结果，返回 (起始行, 函数名) 区间表。
+
+    后出现的（更内层的）符号覆盖先出现的，与逐行查找的结果一致。
+    """
+    painted: list[Optional[str]] = []
+
+    def _paint(syms: list[dict[str, Any]]) -> None:
+        for symbol in syms:
+            if symbol.get("kind") in _FUNC_KINDS:
+                rng = symbol.get("location", _EMPTY).get("range", _EMPTY)
+                start_line = rng.get("start", _EMPTY).get("line", -1)
+                end_line = rng.get("end", _EMPTY).get("line", -1)
+                if 0 <= start_line <= end_line:
+                    if len(painted) <= end_line:
+                        painted.extend([None] * (end_line + 1 - len(painted)))
+                    name = symbol.get("name", "")
+                    painted[start_line : end_line + 1] = [name] * (
+                        end_line + 1 - start_line
+                    )
+
+            children = symbol.get("children")
+            if children:
+                _paint(children)
+
+    try:
+        _paint(symbols or [])
+    except Exception as e:
+        logger.trace(f"Error building function index: {e}")
+        painted = []
+
+    starts: list[int] = []
+    names: list[Optional[str]] = []
+    for line, name in enumerate(painted):
+        if not names or names[-1] != name:
+            starts.append(line)
+            names.append(name)
+    starts.append(len(painted))
+    names.append(None)
+    return starts, names
+
+
+def lookup_enclosing_function(
+    index: tuple[list[int], list[Optional[str]]],
+    line: int,
+) -> Optional[str]:
+    """在 build_function_index 的结果中二分查找 line 所在的函数"""
+    starts, names = index
+    idx = bisect_right(starts, line) - 1
+    return names[idx] if idx >= 0 else None
+
+
+# 所有类共用一个预编译的正则，按类名比对分组，不再为每个类单独编译
+_CLASS_DEF_RE = re.compile(r"class\s+(\w+)\s*\(([^)]*)\)\s*:")
+
+
 def extract_inheritance_relations(
     content: str,
     symbols: list[dict[str, Any]],
 ) -> dict[str, str]:
     """Extract {child_class: parent_class} from source code and LSP symbols."""
-    lines = content.splitlines()
+    lines = _split_lines(content)
     relations: dict[str, str] = {}
 
     for sym in symbols:
@@ -90,11 +172,11 @@ def extract_inheritance_relations(
             continue
 
         line = lines[line_num].strip()
-        match: Optional[re.Match[str]] = re.search(
-            rf"class\s+{re.escape(name)}\s*\(([^)]*)\)\s*:", line
+        match: Optional[re.Match[str]] = next(
+            (m for m in _CLASS_DEF_RE.finditer(line) if m.group(1) == name), None
         )
         if match:
-            bases = [b.strip() for b in match.group(1).split(",") if b.strip()]
+            bases = [b.strip() for b in match.group(2).split(",") if b.strip()]
             if bases:
                 relations[name] = bases[0]
 
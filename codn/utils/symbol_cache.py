@@ -0,0 +1,88 @@
+import hashlib
+import os
+import sqlite3
+from pathlib import Path
+from typing import Any, Optional
+
+from loguru import logger
+
+from codn.utils.lsp_core import _json_dumps, _json_loads
+
+# 设为 1/true/yes/on 时启用磁盘缓存（默认关闭，不写用户目录）
+CACHE_ENV_VAR = "CODN_SYMBOL_CACHE"
+
+
+def cache_enabled() -> bool:
+    return os.environ.get(CACHE_ENV_VAR, "").strip().lower() in (
+        "1",
+        "true",
+        "yes",
+        "on",
+    )
+
+
+def default_cache_dir() -> Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "codn"
+
+
+def content_hash(content: str) -> bytes:
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).digest()
+
+
+class SymbolCache:
+    """documentSymbol 结果的磁盘缓存，按 (uri, 文件内容哈希) 命中。
+
+    每个 (项目根目录, 语言服务器) 一个 sqlite 文件，server 应包含语言、服务名与版本，
+    服务升级或换用其他服务时不会命中旧结果；打开或读写失败时只记录日志，不影响主流程。
+    """
+
+    def __init__(
+        self, root_uri: str, cache_dir: Optional[Path] = None, server: str = ""
+    ):
+        cache_dir = cache_dir or default_cache_dir()
+        root_key = hashlib.blake2b(
+            f"{root_uri}\0{server}".encode(), digest_size=8
+        ).hexdigest()
+        self.path = cache_dir / f"symbols-{root_key}.sqlite"
+        self._conn: Optional[sqlite3.Connection] = None
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS symbols ("
+                "uri TEXT PRIMARY KEY, content_hash BLOB, symbols BLOB)"
+            )
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Symbol cache disabled ({self.path}): {e}")
+            self._conn = None
+
+    def get_many(self, d_hash: dict[str, bytes]) -> dict[str, Any]:
+        """返回内容哈希未变化的 {uri: symbols}"""
+        if self._conn is None or not d_hash:
+            return {}
+        d_symbols = {}
+        try:
+            for uri, h, raw in self._conn.execute("SELECT * FROM symbols"):
+                if d_hash.get(uri) == h:
+                    d_symbols[uri] = _json_loads(raw)
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to read symbol cache: {e}")
+        return d_symbols
+
+    def put_many(self, items: list[tuple[str, bytes, Any]]) -> None:
+        if self._conn is None or not items:
+            return
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO symbols VALUES (?, ?, ?)",
+                    [(uri, h, _json_dumps(symbols)) for uri, h, symbols in items],
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to write symbol cache: {e}")
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
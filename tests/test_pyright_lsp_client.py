@@ -5,20 +5,29 @@ tests, integration tests, and mocking scenarios.
 """
 
 import asyncio
+import json
 import shutil
-from unittest.mock import AsyncMock, patch  # Mock
+from contextlib import nullcontext
+from unittest.mock import AsyncMock, Mock, patch
 
 import pytest
+from watchfiles import Change
 
 from codn.utils.lsp_core import LSPClientState, LSPConfig
-from codn.utils.lsp_utils import extract_inheritance_relations
+from codn.utils.lsp_utils import (
+    build_function_index,
+    extract_inheritance_relations,
+    lookup_enclosing_function,
+)
 from codn.utils.base_lsp_client import (
     LSPError,
     BaseLSPClient,
+    _coalesce_changes,
     _should_process_file,
     extract_symbol_code,
     find_enclosing_function,
     path_to_file_uri,
+    position_for_name,
 )
 
 
@@ -115,6 +124,122 @@ class TestBaseLSPClient:
         with pytest.raises(LSPError, match="LSP process not available"):
             await client._send({"test": "message"})
 
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("use_orjson", [True, False])
+    async def test_send_message_framing(self, lsp_config, use_orjson):
+        """Test messages are framed the same with and without orjson."""
+        client = BaseLSPClient("file:///test", lsp_config)
+        client.proc = Mock()
+        client.proc.stdin.drain = AsyncMock()
+        if not use_orjson:
+            patcher = patch("codn.utils.lsp_core.orjson", None)
+        else:
+            pytest.importorskip("orjson")
+            patcher = nullcontext()
+
+        with patcher:
+            await client._send({"id": 1, "params": {"text": "é"}})
+
+        data = b"".join(c.args[0] for c in client.proc.stdin.write.call_args_list)
+        header, body = data.split(b"\r\n\r\n", 1)
+        assert header == f"Content-Length: {len(body)}".encode()
+        assert json.loads(body) == {"id": 1, "params": {"text": "é"}}
+
+    @pytest.mark.asyncio
+    async def test_request_message_body(self, lsp_config):
+        """Test requests built from the cached head carry id, method and params."""
+        client = BaseLSPClient("file:///test", lsp_config)
+        client._state = LSPClientState.RUNNING
+        params = {"textDocument": {"uri": "file:///a.py"}}
+
+        async def respond(*parts):
+            msg = json.loads(b"".join(parts))
+            client._pending[msg["id"]].set_result({"id": msg["id"], "result": msg})
+
+        client._send_raw = AsyncMock(side_effect=respond)
+
+        first = await client._request("textDocument/documentSymbol", params)
+        second = await client._request("textDocument/documentSymbol", params)
+
+        assert first == {
+            "jsonrpc": "2.0",
+            "id": first["id"],
+            "method": "textDocument/documentSymbol",
+            "params": params,
+        }
+        assert second["id"] == first["id"] + 1
+        assert not client._pending
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("use_orjson", [True, False])
+    async def test_notify_message_body(self, lsp_config, use_orjson):
+        """Test notifications built from the cached head decode to the full message."""
+        client = BaseLSPClient("file:///test", lsp_config)
+        client._state = LSPClientState.RUNNING
+        client._send_raw = AsyncMock()
+        params = {"textDocument": {"uri": "file:///a.py"}, "text": 'x = "é"'}
+        if not use_orjson:
+            patcher = patch("codn.utils.lsp_core.orjson", None)
+        else:
+            pytest.importorskip("orjson")
+            patcher = nullcontext()
+
+        with patcher:
+            await client._notify("textDocument/didOpen", params)
+
+        body = b"".join(client._send_raw.call_args.args)
+        assert json.loads(body) == {
+            "jsonrpc": "2.0",
+            "method": "textDocument/didOpen",
+            "params": params,
+        }
+
+    @pytest.mark.asyncio
+    async def test_read_headers_and_body(self, lsp_config):
+        """Test reading one framed message from the server stream."""
+        client = BaseLSPClient("file:///test", lsp_config)
+        client.proc = Mock()
+        client.proc.stdout = asyncio.StreamReader()
+        client.proc.stdout.feed_data(
+            b'Content-Length: 8\r\nContent-Type: x\r\n\r\n{"id":1}Content-'
+        )
+        client.proc.stdout.feed_eof()
+
+        assert await client._read_content_length() == 8
+        assert await client._read_body(8) == {"id": 1}
+        assert await client._read_line() == b"Content-"
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("use_orjson", [True, False])
+    async def test_read_body_invalid_utf8(self, lsp_config, use_orjson):
+        """Test a body with invalid UTF-8 still decodes with replacement chars."""
+        client = BaseLSPClient("file:///test", lsp_config)
+        client.proc = Mock()
+        client.proc.stdout = asyncio.StreamReader()
+        body = b'{"id":1,"result":"a\xffb"}'
+        client.proc.stdout.feed_data(body)
+        if not use_orjson:
+            patcher = patch("codn.utils.lsp_core.orjson", None)
+        else:
+            pytest.importorskip("orjson")
+            patcher = nullcontext()
+
+        with patcher:
+            msg = await client._read_body(len(body))
+
+        assert msg == {"id": 1, "result": "a\ufffdb"}
+
+    @pytest.mark.asyncio
+    async def test_read_body_truncated(self, lsp_config):
+        """Test a body cut short by end of stream is dropped."""
+        client = BaseLSPClient("file:///test", lsp_config)
+        client.proc = Mock()
+        client.proc.stdout = asyncio.StreamReader()
+        client.proc.stdout.feed_data(b'{"id":')
+        client.proc.stdout.feed_eof()
+
+        assert await client._read_body(8) is None
+
     # @pytest.mark.asyncio
     # async def test_request_timeout(self, lsp_config):
     #     """Test request timeout handling."""
@@ -163,6 +288,70 @@ class TestBaseLSPClient:
         assert client.file_versions[uri] == 2
         client._notify.assert_called_once()
 
+    @pytest.mark.asyncio
+    async def test_file_state_management_change_unopened(self, mock_lsp_client):
+        """Test changing a file that is not open yet sends didOpen."""
+        client = BaseLSPClient("file:///test")
+        client._notify = AsyncMock()
+
+        uri = "file:///test.py"
+        await asyncio.wait_for(
+            client._manage_file_state(uri, "change", "x = 1"), timeout=1
+        )
+
+        assert uri in client.open_files
+        assert client.file_versions[uri] == 1
+        client._notify.assert_called_once()
+        assert client._notify.call_args.args[0] == "textDocument/didOpen"
+
+    @pytest.mark.asyncio
+    async def test_file_state_management_unchanged_content(self, mock_lsp_client):
+        """Test unchanged content does not send another didChange."""
+        client = BaseLSPClient("file:///test")
+        client._notify = AsyncMock()
+
+        uri = "file:///test.py"
+        await client._manage_file_state(uri, "open", "x = 1")
+        await client._manage_file_state(uri, "change", "x = 1")
+        await client._manage_file_state(uri, "open", "x = 1")
+
+        assert client.file_versions[uri] == 1
+        client._notify.assert_called_once()
+
+        await client._manage_file_state(uri, "change", "x = 2")
+
+        assert client.file_versions[uri] == 2
+        assert client._notify.call_count == 2
+
+        client._notify.side_effect = [LSPError("pipe closed"), None]
+        with pytest.raises(LSPError):
+            await client._manage_file_state(uri, "change", "x = 3")
+        assert await client.read_file(uri) == "x = 2"
+
+        await client._manage_file_state(uri, "change", "x = 3")
+
+        assert client._notify.call_count == 4
+        params = client._notify.call_args.args[1]
+        assert params["contentChanges"] == [{"text": "x = 3"}]
+        assert await client.read_file(uri) == "x = 3"
+
+    @pytest.mark.asyncio
+    async def test_file_state_management_failed_open(self, mock_lsp_client):
+        """Test a didOpen that fails to send is retried as didOpen."""
+        client = BaseLSPClient("file:///test")
+        client._notify = AsyncMock(side_effect=[LSPError("pipe closed"), None])
+
+        uri = "file:///test.py"
+        with pytest.raises(LSPError):
+            await client._manage_file_state(uri, "open", "x = 1")
+        assert uri not in client.open_files
+        assert uri not in client.file_states
+
+        await client._manage_file_state(uri, "open", "x = 1")
+
+        assert client._notify.call_args.args[0] == "textDocument/didOpen"
+        assert client.file_versions[uri] == 1
+
     @pytest.mark.asyncio
     async def test_file_state_management_close(self, mock_lsp_client):
         """Test file state management for closing files."""
@@ -379,6 +568,20 @@ class AnotherClass(TestClass, Mixin):
         result = find_enclosing_function(symbols, 6)
         assert result == "inner_function"
 
+    def test_function_index_matches_linear_lookup(self, sample_symbols):
+        """Test bisect lookup agrees with find_enclosing_function."""
+        index = build_function_index(sample_symbols)
+        for line in range(-1, 30):
+            assert lookup_enclosing_function(index, line) == find_enclosing_function(
+                sample_symbols, line
+            )
+
+    def test_position_for_name_matches_whole_words(self):
+        """Test a called name is not located inside a longer identifier."""
+        code = "logger = get_logger()\nlog(logger)\n"
+        assert position_for_name(code, "log", 10) == {"line": 11, "character": 0}
+        assert position_for_name(code, "get", 10) == {"line": -1, "character": -1}
+
 
 class TestFileWatcher:
     """Test file watcher functionality."""
@@ -416,6 +619,36 @@ class TestFileWatcher:
 
         assert _should_process_file(cache_file, (".py", ".pyi")) is False
 
+    def test_coalesce_changes(self, temp_dir):
+        """Test merging events for the same path within one batch."""
+        kept = temp_dir / "kept.py"
+        kept.write_text("x = 1\n")
+        gone = temp_dir / "gone.py"
+        changes = {
+            (Change.added, str(kept)),
+            (Change.modified, str(kept)),
+            (Change.added, str(gone)),
+            (Change.deleted, str(gone)),
+            (Change.modified, str(temp_dir / "notes.txt")),
+        }
+
+        pending = _coalesce_changes(changes, (".py",))
+
+        assert pending == {kept: Change.added}
+
+    def test_coalesce_changes_removed_without_deleted_event(self, temp_dir):
+        """Test an open file that vanished without a deleted event is closed."""
+        gone = temp_dir / "gone.py"
+        changes = {
+            (Change.added, str(gone)),
+            (Change.modified, str(gone)),
+        }
+        open_files = {path_to_file_uri(str(gone))}
+
+        pending = _coalesce_changes(changes, (".py",), open_files)
+
+        assert pending == {gone: Change.deleted}
+
 
 @pytest.mark.integration
 class TestBaseLSPClientIntegration:
@@ -499,3 +732,37 @@ async def test_concurrent_requests(mock_lsp_client):
 
     assert len(results) == 3
     assert client._request.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_stream_requests_keeps_input_order():
+    """Test stream_requests returns results in input order, None for failures."""
+    client = BaseLSPClient("file:///test")
+
+    async def method(delay, value):
+        await asyncio.sleep(delay)
+        if value is None:
+            raise LSPError("boom")
+        return value
+
+    results = await client.stream_requests(
+        method,
+        [(0.03, "a"), (0.0, None), (0.01, "c")],
+        max_concurrency=3,
+        show_progress=False,
+    )
+
+    assert results == ["a", None, "c"]
+
+
+@pytest.mark.asyncio
+async def test_handle_message_dispatches_notifications():
+    """Test server notifications are routed through the handler table."""
+    client = BaseLSPClient("file:///test")
+    handler = AsyncMock()
+    client._notification_handlers["$/progress"] = handler
+
+    await client._handle_message({"method": "$/progress", "params": {"token": 1}})
+    await client._handle_message({"method": "unknown/method", "params": {}})
+
+    handler.assert_awaited_once_with({"token": 1})
@@ -183,3 +183,17 @@ class MyClass:
     assert "Methods (1)" in output
     assert "foo" in output
     assert "bar" in output
+
+
+def test_show_analyze_welcome_is_cached(capsys):
+    """Tests that the analyze welcome screen renders identically from cache."""
+    from codn.cli_commands import analyze_cli, welcome
+
+    analyze_cli.show_analyze_welcome()
+    first = capsys.readouterr().out
+    analyze_cli.show_analyze_welcome()
+    second = capsys.readouterr().out
+
+    assert "Analysis Commands" in first
+    assert first == second
+    assert "analyze" in welcome._WELCOME_CACHE
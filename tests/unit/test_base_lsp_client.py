@@ -1,7 +1,15 @@
+import asyncio
 from pathlib import Path
 import pytest
 
 from codn.utils.base_lsp_client import (
+    BaseLSPClient,
+    _get_local_path,
+    _line_offsets,
+    _open_project_files,
+    _symbol_cache_server_key,
+    _release_client,
+    client_pool,
     path_to_file_uri,
     extract_symbol_code,
     get_client,
@@ -22,6 +30,16 @@ def test_path_to_file_uri():
     assert path_to_file_uri(str(path)) == expected_uri
 
 
+def test_path_to_file_uri_relative_follows_cwd(monkeypatch, tmp_path):
+    """Tests that cached relative paths still resolve against the current cwd."""
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    monkeypatch.chdir(tmp_path / "a")
+    assert path_to_file_uri("x.py") == (tmp_path / "a" / "x.py").resolve().as_uri()
+    monkeypatch.chdir(tmp_path / "b")
+    assert path_to_file_uri("x.py") == (tmp_path / "b" / "x.py").resolve().as_uri()
+
+
 def test_extract_symbol_code_single_line():
     """Tests extract_symbol_code for a single-line symbol."""
     content = "def my_func(): pass"
@@ -37,6 +55,25 @@ def test_extract_symbol_code_single_line():
     assert extract_symbol_code(symbol, content, strip=True) == "my_func"
 
 
+def test_extract_symbol_code_with_line_offsets():
+    """Tests extract_symbol_code gives the same result with a precomputed offset table."""
+    content = "class A:\r\n    def f(self):\r\n        pass\r\n\nx = 1"
+    offsets = _line_offsets(content)
+    for start, end in [(0, 2), (1, 2), (4, 4), (3, 4), (4, 5), (6, 6)]:
+        symbol = {
+            "location": {
+                "range": {
+                    "start": {"line": start, "character": 2},
+                    "end": {"line": end, "character": 3},
+                }
+            }
+        }
+        for strip in (False, True):
+            assert extract_symbol_code(
+                symbol, content, strip, line_offsets=offsets
+            ) == extract_symbol_code(symbol, content, strip)
+
+
 def test_extract_symbol_code_multi_line():
     """Tests extract_symbol_code for a multi-line symbol."""
     content = "def my_func():\n    return self.value"
@@ -69,6 +106,7 @@ async def test_get_client(mocker, fs):
         def __init__(self, root_uri):
             self.root_uri = root_uri
             self.open_files = []
+            self.local_paths = {}
             self.is_closing = False
             self.did_open_calls = []
 
@@ -156,18 +194,20 @@ async def test_get_snippet(mocker, fs):
     mock_client_instance = mocker.AsyncMock()
     mock_client_instance.open_files = [file_uri]
     mock_client_instance.is_closing = False
-    mock_client_instance.send_document_symbol.return_value = [
-        {
-            "name": "my_function",
-            "kind": 12,  # Function
-            "location": {
-                "uri": file_uri,
-                "range": {
-                    "start": {"line": 0, "character": 0},
-                    "end": {"line": 1, "character": 11},
+    mock_client_instance.stream_requests.return_value = [
+        [
+            {
+                "name": "my_function",
+                "kind": 12,  # Function
+                "location": {
+                    "uri": file_uri,
+                    "range": {
+                        "start": {"line": 0, "character": 0},
+                        "end": {"line": 1, "character": 11},
+                    },
                 },
-            },
-        }
+            }
+        ]
     ]
     mock_client_instance.read_file.return_value = file_content  # Add this line
     mock_client_instance.shutdown = mocker.AsyncMock()
@@ -185,6 +225,132 @@ async def test_get_snippet(mocker, fs):
     snippets = await get_snippet(entity_name="my_function", path_str="/tmp/project")
 
     # Assertions
-    mock_client_instance.send_document_symbol.assert_called_once_with(file_uri)
+    mock_client_instance.stream_requests.assert_called_once_with(
+        mock_client_instance.send_document_symbol,
+        [(file_uri,)],
+        max_concurrency=20,
+        show_progress=False,
+    )
     mock_client_instance.shutdown.assert_called_once()
     assert snippets == [file_content]
+
+
+@pytest.mark.asyncio
+async def test_client_pool_reuses_client(mocker, tmp_path):
+    """Tests that get_client reuses one client per root inside client_pool."""
+    mock_client_instance = mocker.AsyncMock()
+    mock_client_instance.is_closing = False
+    mock_client_instance.root_uri = tmp_path.resolve().as_uri()
+    mock_client_cls = mocker.patch(
+        "codn.utils.base_lsp_client.BaseLSPClient",
+        return_value=mock_client_instance,
+    )
+    mocker.patch(
+        "codn.utils.base_lsp_client.detect_dominant_languages", return_value=["py"]
+    )
+
+    async with client_pool(watch=False):
+        assert await get_client(str(tmp_path)) is mock_client_instance
+        assert await get_client(str(tmp_path)) is mock_client_instance
+        await _release_client(mock_client_instance)
+        mock_client_instance.shutdown.assert_not_called()
+
+    mock_client_cls.assert_called_once()
+    mock_client_instance.shutdown.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_client_pool_concurrent_get_client(mocker, tmp_path):
+    """Tests that concurrent get_client calls in a pool start one client."""
+    mock_client_instance = mocker.AsyncMock()
+    mock_client_instance.is_closing = False
+    mock_client_instance.root_uri = tmp_path.resolve().as_uri()
+    mock_client_cls = mocker.patch(
+        "codn.utils.base_lsp_client.BaseLSPClient",
+        return_value=mock_client_instance,
+    )
+    mocker.patch(
+        "codn.utils.base_lsp_client.detect_dominant_languages", return_value=["py"]
+    )
+
+    async with client_pool(watch=False):
+        clients = await asyncio.gather(*(get_client(str(tmp_path)) for _ in range(3)))
+        assert all(c is mock_client_instance for c in clients)
+
+    mock_client_cls.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_client_pool_startup_survives_cancelled_caller(mocker, tmp_path):
+    """Tests that cancelling a get_client caller does not abort a pooled startup."""
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow_start(lang):
+        started.set()
+        await release.wait()
+
+    mock_client_instance = mocker.AsyncMock()
+    mock_client_instance.is_closing = False
+    mock_client_instance.root_uri = tmp_path.resolve().as_uri()
+    mock_client_instance.start.side_effect = slow_start
+    mock_client_cls = mocker.patch(
+        "codn.utils.base_lsp_client.BaseLSPClient",
+        return_value=mock_client_instance,
+    )
+    mocker.patch(
+        "codn.utils.base_lsp_client.detect_dominant_languages", return_value=["py"]
+    )
+
+    async with client_pool(watch=False):
+        caller = asyncio.create_task(get_client(str(tmp_path)))
+        await started.wait()
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        release.set()
+        assert await get_client(str(tmp_path)) is mock_client_instance
+        mock_client_instance.shutdown.assert_not_called()
+
+    mock_client_cls.assert_called_once()
+    mock_client_instance.shutdown.assert_called_once()
+
+
+def test_symbol_cache_server_key():
+    """Tests the symbol cache key tracks language, server name and version."""
+    client = BaseLSPClient("file:///project")
+    client.lang = "c"
+    client.server_info = {"name": "clangd", "version": "17.0.6"}
+    assert _symbol_cache_server_key(client) == "c:clangd:17.0.6"
+
+    client.server_info = {"name": "clangd", "version": "18.1.0"}
+    assert _symbol_cache_server_key(client) == "c:clangd:18.1.0"
+
+
+@pytest.mark.asyncio
+async def test_open_project_files_cancels_siblings_on_failure(mocker, tmp_path):
+    """Tests a non-UTF-8 file fails the open pass without leaving tasks behind."""
+    for i in range(5):
+        (tmp_path / f"ok_{i}.py").write_text(f"x = {i}\n")
+    (tmp_path / "bad.py").write_bytes(b"\xff\xfe\x00")
+
+    async def never_returns(*args):
+        await asyncio.Event().wait()
+
+    client = mocker.AsyncMock()
+    client.local_paths = {}
+    client.send_did_open.side_effect = never_returns
+
+    with pytest.raises(UnicodeDecodeError):
+        await _open_project_files(client, str(tmp_path), tmp_path, "py")
+
+    assert asyncio.all_tasks() == {asyncio.current_task()}
+
+
+def test_get_local_path_on_plain_client():
+    """Tests a directly constructed client caches root-relative paths."""
+    client = BaseLSPClient("file:///project")
+    uri = "file:///project/pkg/a%20b.py"
+
+    assert _get_local_path(client, uri, "/project") == "pkg/a b.py"
+    assert client.local_paths == {uri: "pkg/a b.py"}
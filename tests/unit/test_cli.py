@@ -15,7 +15,7 @@ def test_version_command():
 
 def test_default_command_calls_analyze_project(mocker):
     """Tests that running `codn` without subcommands calls analyze_project."""
-    mock_analyze_project = mocker.patch("codn.cli.analyze_project")
+    mock_analyze_project = mocker.patch("codn.cli_commands.analyze_cli.analyze_project")
 
     result = runner.invoke(app, [])
 
@@ -25,7 +25,9 @@ def test_default_command_calls_analyze_project(mocker):
 
 def test_unused_command_calls_find_unused_imports_cmd(mocker):
     """Tests that the `unused` command calls find_unused_imports_cmd."""
-    mock_find_unused_imports_cmd = mocker.patch("codn.cli.find_unused_imports_cmd")
+    mock_find_unused_imports_cmd = mocker.patch(
+        "codn.cli_commands.analyze_cli.find_unused_imports_cmd"
+    )
 
     result = runner.invoke(app, ["unused"])
 
@@ -35,7 +37,7 @@ def test_unused_command_calls_find_unused_imports_cmd(mocker):
 
 def test_refs_command_calls_find_references(mocker):
     """Tests that the `refs` command calls find_references."""
-    mock_find_references = mocker.patch("codn.cli.find_references")
+    mock_find_references = mocker.patch("codn.cli_commands.analyze_cli.find_references")
 
     result = runner.invoke(app, ["refs", "my_func"])
 
@@ -45,7 +47,9 @@ def test_refs_command_calls_find_references(mocker):
 
 def test_funcs_command_calls_analyze_functions(mocker):
     """Tests that the `funcs` command calls analyze_functions."""
-    mock_analyze_functions = mocker.patch("codn.cli.analyze_functions")
+    mock_analyze_functions = mocker.patch(
+        "codn.cli_commands.analyze_cli.analyze_functions"
+    )
 
     result = runner.invoke(app, ["funcs"])
 
@@ -53,3 +57,17 @@ def test_funcs_command_calls_analyze_functions(mocker):
     mock_analyze_functions.assert_called_once_with(
         None, class_name=None, show_signatures=False, include_tests=False
     )
+
+
+def test_argv_sniffing():
+    """Tests the argv helpers used before the Typer app is built."""
+    from codn.cli import _sniff_subcommand, _wants_version
+
+    assert _sniff_subcommand(["codn", "-v", "git", "check"]) == "git"
+    assert _sniff_subcommand(["codn", "refs", "unused"]) == "refs"
+    assert _sniff_subcommand(["codn", "--help"]) is None
+    assert _sniff_subcommand(["codn", "foo"]) is None
+
+    assert _wants_version(["codn", "-V"])
+    assert _wants_version(["codn", "-v", "--version"])
+    assert not _wants_version(["codn", "refs", "-V"])
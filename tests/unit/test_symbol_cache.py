@@ -0,0 +1,60 @@
+"""Unit tests for codn.utils.symbol_cache module."""
+
+import pytest
+
+from codn.utils.symbol_cache import SymbolCache, cache_enabled, content_hash
+
+
+class TestSymbolCache:
+    """Test cases for SymbolCache."""
+
+    def test_hit_requires_same_content(self, tmp_path):
+        """Test cached symbols are returned only while the content hash matches."""
+        symbols = [{"name": "foo", "kind": 12}]
+        cache = SymbolCache("file:///project", cache_dir=tmp_path)
+        cache.put_many(
+            [("file:///project/a.py", content_hash("def foo(): pass"), symbols)]
+        )
+        cache.close()
+
+        cache = SymbolCache("file:///project", cache_dir=tmp_path)
+        hit = cache.get_many({"file:///project/a.py": content_hash("def foo(): pass")})
+        miss = cache.get_many({"file:///project/a.py": content_hash("def bar(): pass")})
+        cache.close()
+
+        assert hit == {"file:///project/a.py": symbols}
+        assert miss == {}
+
+    def test_unwritable_cache_dir(self, tmp_path):
+        """Test the cache degrades to a no-op when it cannot be opened."""
+        blocker = tmp_path / "not_a_dir"
+        blocker.write_text("")
+
+        cache = SymbolCache("file:///project", cache_dir=blocker)
+        cache.put_many([("file:///project/a.py", content_hash(""), [])])
+
+        assert cache.get_many({"file:///project/a.py": content_hash("")}) == {}
+
+    def test_server_is_part_of_cache_key(self, tmp_path):
+        """Test results cached for one server version are not served to another."""
+        h = content_hash("def foo(): pass")
+        cache = SymbolCache("file:///project", tmp_path, server="py:pyright:1.1.400")
+        cache.put_many([("file:///project/a.py", h, [{"name": "foo"}])])
+        cache.close()
+
+        cache = SymbolCache("file:///project", tmp_path, server="py:pyright:1.1.401")
+        assert cache.get_many({"file:///project/a.py": h}) == {}
+        cache.close()
+
+
+@pytest.mark.parametrize(
+    ("value", "expected"),
+    [(None, False), ("", False), ("0", False), ("1", True), ("True", True)],
+)
+def test_cache_enabled_env(monkeypatch, value, expected):
+    """Test the disk cache is opt-in through CODN_SYMBOL_CACHE."""
+    if value is None:
+        monkeypatch.delenv("CODN_SYMBOL_CACHE", raising=False)
+    else:
+        monkeypatch.setenv("CODN_SYMBOL_CACHE", value)
+    assert cache_enabled() is expected